@@ -0,0 +1,184 @@
+#Headless benchmark of scripted edit sessions
+#Usage: blender --background --python benchmarks/benchmark.py -- [--engine mock|real] [--drags 200]
+#       [--sizes 3,4,5,6] [--segments 4] [--latency 0] [--text] [--output results.json]
+#Each session runs on an ico sphere per size: add spline, add control points, N drags, split, close, delete
+#The sessions run the editing code of the operators (spline.add_spline, edit.CurveEditing) event by event,
+#the modal operators themselves need a 3D viewport and cannot run in background mode
+#Against the mock engine (canned answers) the timings are the add-on overhead, against the real engine
+#(bezier/bin/splinegui) they include the geodesic computation
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import bpy
+
+dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) #Add-on directory
+sys.path.append(dir)
+
+import utils
+import spline
+import edit
+import profiling
+
+def parse_args():
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+    parser = argparse.ArgumentParser(prog="benchmark.py")
+    parser.add_argument("--engine", choices=["mock", "real"], default="mock")
+    parser.add_argument("--drags", type=int, default=200)
+    parser.add_argument("--sizes", default="3,4,5,6", help="ico sphere subdivisions of the reference meshes")
+    parser.add_argument("--segments", type=int, default=4, help="segments of the spline before dragging")
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated computation time of the mock engine (s)")
+    parser.add_argument("--text", action="store_true", help="use the text protocol")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None)
+    return parser.parse_args(argv)
+
+#Triangulated ico sphere with its geo key, the reference mesh of a size
+def reference_mesh(size):
+    bpy.ops.mesh.primitive_ico_sphere_add(subdivisions=size, radius=1.0)
+    obj = bpy.context.active_object
+    obj.name = "benchmark_ico_" + str(size)
+    spline.add_target(obj)
+    return obj
+
+def random_point(mesh, rng):
+    u = rng.random()
+    v = rng.random() * (1 - u)
+    return [rng.randrange(len(mesh.polygons)), [u, v]]
+
+#Edit session of the operators: a spline is added as GeodesicCurve does, then edited with the
+#methods EditCurveOperator runs for each event
+class Session(edit.CurveEditing):
+    def __init__(self, obj, rng):
+        edit.CurveEditing.__init__(self)
+        self.obj = obj
+        self.rng = rng
+    
+    def report(self, type, message):
+        print(message)
+    
+    def invalidate_target(self):
+        raise RuntimeError("Engine request failed")
+
+    def add_spline(self):
+        context = bpy.context
+        points_bar = [random_point(self.obj.data, self.rng) for i in range(3)]
+        points_bar.append(points_bar[-1])
+        with profiling.stage("session add spline"):
+            self.curve_key = spline.add_spline(self.obj, points_bar)[utils.key_name]
+            self.init_refs()
+            context.scene.curr_idx = 0
+            self.subdivisions = context.scene.subdivisions
+            self.draw_curve()
+            self.draw_tan(context)
+
+    def add_point(self):
+        context = bpy.context
+        new_point = random_point(self.obj.data, self.rng)
+        with profiling.stage("session add point"):
+            self.extend(context, new_point)
+            self.draw_tan(context)
+
+    #Drag of a control point: curve, smooth tangent rotation and tangent paths
+    def drag(self):
+        context = bpy.context
+        context.scene.curr_idx = self.rng.randrange(len(self.points_bar))
+        new_point = random_point(self.obj.data, self.rng)
+        with profiling.stage("session drag"):
+            self.apply_drag(context, self.move_point(context, new_point))
+
+    def split_session(self):
+        context = bpy.context
+        self.t0 = self.rng.random() * (len(self.points_bar) // 3)
+        with profiling.stage("session split"):
+            self.start_split()
+            self.split(context)
+            self.draw_curve()
+            self.draw_tan(context)
+
+    def close(self):
+        with profiling.stage("session close"):
+            self.close_curve(bpy.context)
+
+    #Delete the segment after the second anchor
+    def delete(self):
+        context = bpy.context
+        context.scene.curr_idx = 3
+        with profiling.stage("session delete"):
+            self.delete_segment(context)
+            self.draw_curve()
+            self.draw_tan(context)
+
+    def remove(self):
+        data = self.curve.data
+        materials = list(data.materials)
+        bpy.data.objects.remove(self.curve, do_unlink=True)
+        bpy.data.curves.remove(data)
+        for material in materials: bpy.data.materials.remove(material)
+
+def run_mesh(args, size, rng):
+    obj = reference_mesh(size)
+    mesh = obj.data
+    comm = utils.ServerCommunication()
+    if args.engine == "mock":
+        command = [sys.executable, os.path.join(dir, "benchmarks", "mock_engine.py"), "--latency", str(args.latency)]
+        digest = None
+    else:
+        command = None
+        digest = utils.mesh_digest(mesh)
+    mesh_file = utils.export_mesh(mesh, os.path.join(dir, "bezier", "data"))
+    start = time.perf_counter()
+    utils.run_spline_server(dir, comm, mesh_file, digest, command)
+    launch = time.perf_counter() - start
+    profiling.reset()
+    try:
+        #Requests of the editing code go to the engine of the spline module
+        spline.comm = comm
+        spline.send_params()
+        session = Session(obj, rng)
+        session.add_spline()
+        for i in range(args.segments - 1): session.add_point()
+        start = time.perf_counter()
+        for i in range(args.drags): session.drag()
+        drag_time = time.perf_counter() - start
+        session.split_session()
+        session.close()
+        session.delete()
+        session.remove()
+    finally:
+        utils.close_spline_server(comm)
+    result = {
+        "mesh": "ico_" + str(size),
+        "vertices": len(mesh.vertices),
+        "triangles": len(mesh.polygons),
+        "engine_launch_s": launch,
+        "drags_per_s": args.drags / drag_time if drag_time > 0 else None,
+        "operations": profiling.summary()
+        }
+    bpy.data.objects.remove(obj, do_unlink=True)
+    return result
+
+def print_result(result):
+    print("%s: %d vertices, %d triangles, launch %.3fs, %.1f drags/s" % (result["mesh"], result["vertices"], result["triangles"], result["engine_launch_s"], result["drags_per_s"] or 0))
+    for name, stats in result["operations"].items():
+        print("    %-28s n=%-5d p50 %8.3f ms  p95 %8.3f ms" % (name, stats["count"], stats["p50"], stats["p95"]))
+
+def main():
+    args = parse_args()
+    scene = bpy.context.scene
+    scene.binary_protocol = not args.text
+    scene.profiling = True
+    profiling.set_enabled(True)
+    rng = random.Random(args.seed)
+    results = []
+    for size in [int(s) for s in args.sizes.split(",")]:
+        result = run_mesh(args, size, rng)
+        print_result(result)
+        results.append(result)
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump({"engine": args.engine, "protocol": "text" if args.text else "binary", "drags": args.drags, "unit": "ms", "meshes": results}, f, indent=2)
+
+main()
@@ -0,0 +1,134 @@
+#Stand-in for bezier/bin/splinegui speaking the same socket protocols (text and binary)
+#Answers with canned points built from the request control points, no geodesic is computed,
+#so a benchmark against it measures the add-on overhead only
+#Usage: python mock_engine.py mesh [--port 0] [--binary] [--latency seconds]
+#Other engine options (--cache, --hash, --cache-size) are accepted and ignored
+import sys
+import time
+import socket
+import struct
+import argparse
+
+FRAME_HEADER = struct.Struct('<IcBHid')
+POINT_RECORD = struct.Struct('<idd')
+
+class Engine:
+    def __init__(self, latency):
+        self.latency = latency #Simulated computation time of each answered request
+        self.subdivisions = 4
+
+    #Point at t along p0 -> p1, kept in the face of p0
+    def lerp(self, p0, p1, t):
+        return (p0[0], p0[1] + (p1[1] - p0[1])*t, p0[2] + (p1[2] - p0[2])*t)
+
+    def curve(self, points):
+        n = 3 * 2**self.subdivisions
+        return [self.lerp(points[0], points[3], i/n) for i in range(n + 1)]
+
+    #Answer of a request, list of polylines (a single point is a polyline of one point)
+    #None for requests without answer
+    def answer(self, op, flag, param, points):
+        if op == 'o':
+            self.subdivisions = int(param)
+            return None
+        if self.latency: time.sleep(self.latency)
+        if op == 'n': return [[points[0]]]
+        if op == 'r': return [[points[2] if flag else points[0]]]
+        if op == 'l': return [[points[0], points[1]]]
+        if op == 'p': return [[self.lerp(points[0], points[3], param)]]
+        if op == 's':
+            mid = self.lerp(points[0], points[3], param)
+            return [[points[0], points[1], mid, mid, mid, points[2], points[3]]]
+        if op == 'm': return [self.curve(points[i:i+4]) for i in range(0, len(points) - 3, 4)]
+        if op == 'c': return [self.curve(points)]
+        raise ValueError(op)
+
+#----------BINARY PROTOCOL------------------------------------------------------
+def recv_exact(conn, size):
+    buf = b""
+    while len(buf) < size:
+        data = conn.recv(size - len(buf))
+        if not data: raise ConnectionError("Client closed the connection")
+        buf += data
+    return buf
+
+def serve_binary(conn, engine):
+    while True:
+        size, op, flag, request_id, count, param = FRAME_HEADER.unpack(recv_exact(conn, FRAME_HEADER.size))
+        payload = recv_exact(conn, size)
+        points = [POINT_RECORD.unpack_from(payload, i*POINT_RECORD.size) for i in range(count)]
+        op = op.decode()
+        if op == 'a': return
+        try: polys = engine.answer(op, flag, param, points)
+        except ValueError:
+            #Unknown request, empty error frame as the engine
+            conn.sendall(FRAME_HEADER.pack(0, b'e', 0, request_id, 0, 0.0))
+            continue
+        if polys is None: continue
+        answer_op = b'c' if op in ('c', 'm') else op.encode()
+        out = b""
+        for poly in polys:
+            out += FRAME_HEADER.pack(len(poly)*POINT_RECORD.size, answer_op, 0, request_id, len(poly), 0.0)
+            out += b"".join(POINT_RECORD.pack(*p) for p in poly)
+        conn.sendall(out)
+
+#----------TEXT PROTOCOL----------------------------------------------------------
+#Requests are read line by line, several requests sent back to back can arrive in one recv
+#Lines of each request after the command line: points of 3 lines (face, u, v), t0 for 'p' and 's'
+def read_lines(reader, n):
+    lines = [reader.readline() for i in range(n)]
+    if n and not lines[-1]: raise ConnectionError("Client closed the connection")
+    return [line.strip() for line in lines]
+
+def read_points(lines):
+    return [(int(lines[i]), float(lines[i+1]), float(lines[i+2])) for i in range(0, len(lines) - 2, 3)]
+
+def point2str(p):
+    return "%d %f %f\n" % p
+
+def serve_text(conn, engine):
+    reader = conn.makefile('r')
+    while True:
+        cmd = reader.readline().strip()
+        if not cmd or cmd[0] == 'a': return
+        if cmd[0] == 'o':
+            subdivisions, precision, parallel = read_lines(reader, 3)
+            engine.answer('o', 0, float(subdivisions), [])
+            conn.sendall(b"o\n")
+            continue
+        if cmd in ('n', 'l'): polys = engine.answer(cmd, 0, 0.0, read_points(read_lines(reader, 6)))
+        elif cmd[0] == 'r': polys = engine.answer('r', int(cmd[1]), 0.0, read_points(read_lines(reader, 9)))
+        elif cmd in ('p', 's'):
+            lines = read_lines(reader, 13)
+            polys = engine.answer(cmd, 0, float(lines[0]), read_points(lines[1:]))
+        else: 
+            #Curve request, no command line: the first line is the face of the first point
+            polys = engine.answer('c', 0, 0.0, read_points([cmd] + read_lines(reader, 11)))
+        poly = polys[0]
+        if cmd[0] in ('n', 'r', 'p'): conn.sendall(point2str(poly[0]).encode())
+        else: conn.sendall((str(len(poly)) + "\n" + "".join(point2str(p) for p in poly)).encode())
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("mesh")
+    parser.add_argument("--port", type=int, default=27015)
+    parser.add_argument("--binary", action="store_true")
+    parser.add_argument("--latency", type=float, default=0.0)
+    args, _ = parser.parse_known_args()
+
+    listen = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listen.bind(("127.0.0.1", args.port))
+    listen.listen(1)
+    print("ready", listen.getsockname()[1], flush=True)
+    conn, _ = listen.accept()
+    conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    engine = Engine(args.latency)
+    try:
+        if args.binary: serve_binary(conn, engine)
+        else: serve_text(conn, engine)
+    except ConnectionError: pass
+    conn.close()
+    listen.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+#Replay of an engine trace captured with the engine_trace option (bezier/data/traces)
+#The requests of the trace are sent to a new engine, answers are compared with the recorded ones
+#and the latency of each request with the recorded latency
+#Usage: python replay.py trace.gtrc mesh [--engine bezier/bin/splinegui] [--paced] [--tolerance 1e-5]
+#       [--max-regression 0.2] [--output report.json]
+#The engine is a command line, "python mock_engine.py" replays against the mock engine
+#The mesh is the one the trace was captured on (a bezier/data/mesh_<hash>.bin export or an obj file)
+#Exit status 1 if an answer differs or the p95 latency of an operation regressed more than max-regression
+import os
+import sys
+import json
+import time
+import shlex
+import socket
+import struct
+import hashlib
+import argparse
+import threading
+import subprocess
+
+TRACE_HEADER = struct.Struct('<4sBB32s')
+TRACE_RECORD = struct.Struct('<cdI')
+FRAME_HEADER = struct.Struct('<IcBHid')
+POINT_RECORD = struct.Struct('<idd')
+MESH_HEADER = struct.Struct('<4sII')
+
+#Output: binary protocol flag, mesh content hash, list of records (direction, time, payload), trace version
+def read_trace(path):
+    with open(path, 'rb') as f: data = f.read()
+    if len(data) < TRACE_HEADER.size: raise ValueError(path + " is not an engine trace")
+    magic, version, binary, digest = TRACE_HEADER.unpack_from(data)
+    if magic != b"GTRC": raise ValueError(path + " is not an engine trace")
+    if version not in (1, 2): raise ValueError("Unsupported trace version " + str(version))
+    records = []
+    pos = TRACE_HEADER.size
+    while pos + TRACE_RECORD.size <= len(data):
+        direction, t, size = TRACE_RECORD.unpack_from(data, pos)
+        pos += TRACE_RECORD.size
+        if pos + size > len(data): break
+        records.append((direction, t, data[pos:pos + size]))
+        pos += size
+    #Last record cut short if Blender was killed while writing it
+    if pos != len(data): print("Warning: truncated trace, replaying the first %d records" % len(records))
+    return bool(binary), digest.rstrip(b"\0").decode(), records, version
+
+#Content hash of a binary mesh export, as utils.mesh_digest
+def mesh_file_digest(path):
+    try:
+        with open(path, 'rb') as f: data = f.read()
+    except OSError: return None
+    if data[:4] != b"GMSH": return None
+    return hashlib.blake2b(data[MESH_HEADER.size:], digest_size=16).hexdigest()
+
+class Request:
+    def __init__(self, op, payload, request_id = 0, frames = 1):
+        self.op = op
+        self.payload = payload #Bytes sent to the engine
+        self.request_id = request_id
+        self.frames = frames #Answer frames (binary) or answer kind 'point'/'poly'/'ack' (text), 0 if none
+        self.sent = None
+        self.done = None
+        self.answer = []
+        self.event = threading.Event()
+
+    def latency(self):
+        return self.done - self.sent
+
+#Requests of a sent record
+#Input: acked if the engine acknowledges the text params (traces from version 2)
+def parse_requests(binary, data, acked = True):
+    if not binary:
+        cmd = data.split(b"\n", 1)[0].decode()
+        op = cmd[0] if cmd[0] in "norlpsa" else 'c'
+        if op == 'o' and acked: frames = 'ack'
+        elif op in ('o', 'a'): frames = 0
+        elif op in ('n', 'r', 'p'): frames = 'point'
+        else: frames = 'poly'
+        return [Request(op, data, frames=frames)]
+    requests = []
+    pos = 0
+    while pos < len(data):
+        size, op, flag, request_id, count, param = FRAME_HEADER.unpack_from(data, pos)
+        end = pos + FRAME_HEADER.size + size
+        op = op.decode()
+        if op in ('o', 'a'): frames = 0
+        elif op == 'm': frames = count // 4
+        else: frames = 1
+        requests.append(Request(op, data[pos:end], request_id, frames))
+        pos = end
+    return requests
+
+#Incremental parser of the engine answers, matched to the requests in the order they were sent
+class AnswerReader:
+    def __init__(self, binary):
+        self.binary = binary
+        self.buf = b""
+        self.lock = threading.Lock()
+        self.waiting = {} #binary: request id -> requests waiting for answers, oldest first
+        self.queue = [] #text: requests waiting for answers, oldest first
+
+    def expect(self, request):
+        if not request.frames: return
+        with self.lock:
+            if self.binary: self.waiting.setdefault(request.request_id, []).append(request)
+            else: self.queue.append(request)
+
+    def complete(self, request, t):
+        request.done = t
+        request.event.set()
+
+    def feed(self, data, t):
+        self.buf += data
+        if self.binary: self.feed_frames(t)
+        else: self.feed_lines(t)
+
+    def feed_frames(self, t):
+        while len(self.buf) >= FRAME_HEADER.size:
+            size, op, flag, request_id, count, param = FRAME_HEADER.unpack_from(self.buf)
+            end = FRAME_HEADER.size + size
+            if len(self.buf) < end: return
+            poly = [POINT_RECORD.unpack_from(self.buf, FRAME_HEADER.size + i*POINT_RECORD.size) for i in range(count)]
+            self.buf = self.buf[end:]
+            with self.lock:
+                requests = self.waiting.get(request_id)
+                if not requests: continue
+                request = requests[0]
+                request.answer.append(poly)
+                #An error frame ends the answer of a rejected request
+                if op != b'e' and len(request.answer) < request.frames: continue
+                requests.pop(0)
+            self.complete(request, t)
+
+    def feed_lines(self, t):
+        while True:
+            with self.lock:
+                if not self.queue: return
+                request = self.queue[0]
+            lines = self.buf.split(b"\n")[:-1] #Last element is an incomplete line
+            if request.frames in ('point', 'ack'): needed = 1
+            elif lines: needed = 1 + int(lines[0])
+            else: return
+            if len(lines) < needed: return
+            if request.frames == 'ack': points = []
+            else: points = lines[1:needed] if request.frames == 'poly' else lines[:1]
+            poly = []
+            for line in points:
+                f, u, v = line.split()
+                poly.append((int(f), float(u), float(v)))
+            request.answer = [poly]
+            self.buf = b"\n".join(self.buf.split(b"\n")[needed:])
+            with self.lock: self.queue.pop(0)
+            self.complete(request, t)
+
+#Requests of the trace with the recorded answers and send/answer times
+def recorded_requests(binary, records, acked = True):
+    reader = AnswerReader(binary)
+    requests = []
+    for direction, t, data in records:
+        if direction == b">":
+            for request in parse_requests(binary, data, acked):
+                request.sent = t
+                reader.expect(request)
+                requests.append(request)
+        else: reader.feed(data, t)
+    return requests
+
+def launch_engine(engine, mesh, binary):
+    args = shlex.split(engine) + [mesh, "--port", "0"]
+    if binary: args.append("--binary")
+    process = subprocess.Popen(args, universal_newlines=True, stdout=subprocess.PIPE)
+    for line in process.stdout:
+        if line.startswith("ready "):
+            port = int(line.split()[1])
+            break
+    else: raise RuntimeError("engine exited before being ready")
+    #Engine logs are discarded, an unread pipe would block the engine once full
+    threading.Thread(target=lambda: [None for line in process.stdout], daemon=True).start()
+    sock = socket.create_connection(("127.0.0.1", port))
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return process, sock
+
+#Send the requests of the trace again
+#A request is sent once the answers received before it in the trace are received, so the engine
+#sees the same requests outstanding as during the capture; paced also keeps the recorded gaps between requests
+def replay(sock, binary, recorded, paced):
+    reader = AnswerReader(binary)
+    start = time.perf_counter()
+    def read_loop():
+        while True:
+            try: data = sock.recv(65536)
+            except OSError: return
+            if not data: return
+            reader.feed(data, time.perf_counter() - start)
+    threading.Thread(target=read_loop, daemon=True).start()
+
+    #Replayed requests are parsed again, the params of traces without acknowledgement are acknowledged by the engine
+    requests = [parse_requests(binary, r.payload)[0] for r in recorded if r.op != 'a']
+    sources = [r for r in recorded if r.op != 'a']
+    answered = sorted((i for i, r in enumerate(sources) if r.frames and r.done is not None), key=lambda i: sources[i].done)
+    waited = 0
+    previous = None #Last request sent and its source
+    for request, source in zip(requests, sources):
+        while waited < len(answered) and sources[answered[waited]].done <= source.sent:
+            requests[answered[waited]].event.wait()
+            waited += 1
+        #The text protocol has no framing, the engine reads a request per recv: the gap after a request
+        #without answer is kept, or the next one could be read with it
+        if previous is not None and (paced or not binary and not previous[0].frames):
+            delay = (source.sent - previous[1].sent) - (time.perf_counter() - start - previous[0].sent)
+            if delay > 0: time.sleep(delay)
+        previous = request, source
+        reader.expect(request)
+        request.sent = time.perf_counter() - start
+        sock.sendall(request.payload)
+    for request in requests:
+        if request.frames: request.event.wait()
+    return sources, requests
+
+#Output: description of the first difference of two answers, None if equal within tolerance
+def compare(recorded, replayed, tolerance):
+    if len(recorded) != len(replayed): return "%d polylines instead of %d" % (len(replayed), len(recorded))
+    for a, b in zip(recorded, replayed):
+        if len(a) != len(b): return "%d points instead of %d" % (len(b), len(a))
+        for (fa, ua, va), (fb, ub, vb) in zip(a, b):
+            if fa != fb: return "face %d instead of %d" % (fb, fa)
+            if abs(ua - ub) > tolerance or abs(va - vb) > tolerance: return "coords differ by %g" % max(abs(ua - ub), abs(va - vb))
+    return None
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("trace")
+    parser.add_argument("mesh")
+    parser.add_argument("--engine", default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bezier", "bin", "splinegui"))
+    parser.add_argument("--paced", action="store_true", help="keep the recorded time between requests")
+    parser.add_argument("--tolerance", type=float, default=1e-5, help="largest barycentric coords difference of equal answers")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="largest relative p95 latency increase")
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    binary, digest, records, version = read_trace(args.trace)
+    mesh_digest = mesh_file_digest(args.mesh)
+    if digest and mesh_digest is not None and mesh_digest != digest:
+        print("Warning: the mesh is not the one of the trace")
+    recorded = recorded_requests(binary, records, version >= 2)
+
+    process, sock = launch_engine(args.engine, args.mesh, binary)
+    try:
+        start = time.perf_counter()
+        sources, requests = replay(sock, binary, recorded, args.paced)
+        duration = time.perf_counter() - start
+    finally:
+        if binary: sock.sendall(FRAME_HEADER.pack(0, b"a", 0, 0, 0, 0.0))
+        else: sock.sendall(b"a\n")
+        sock.close()
+        process.wait()
+
+    mismatches = []
+    latencies = {} #op -> recorded and replayed latencies
+    for i, (source, request) in enumerate(zip(sources, requests)):
+        if not request.frames or source.done is None: continue
+        difference = compare(source.answer, request.answer, args.tolerance)
+        if difference is not None: mismatches.append({"request": i, "op": source.op, "difference": difference})
+        recorded_ms, replayed_ms = latencies.setdefault(source.op, ([], []))
+        recorded_ms.append(source.latency() * 1000)
+        replayed_ms.append(request.latency() * 1000)
+
+    operations = {}
+    regressions = []
+    for op in sorted(latencies):
+        recorded_ms, replayed_ms = latencies[op]
+        stats = {"count": len(recorded_ms)}
+        for p in (50, 95):
+            stats["recorded_p" + str(p)] = percentile(recorded_ms, p)
+            stats["replayed_p" + str(p)] = percentile(replayed_ms, p)
+        operations[op] = stats
+        print("%s: n=%-6d p50 %8.3f -> %8.3f ms  p95 %8.3f -> %8.3f ms" % (op, stats["count"], stats["recorded_p50"], stats["replayed_p50"], stats["recorded_p95"], stats["replayed_p95"]))
+        if stats["replayed_p95"] > stats["recorded_p95"] * (1 + args.max_regression): regressions.append(op)
+    recorded_duration = sources[-1].sent if sources else 0.0
+    print("%d requests replayed in %.3fs (recorded session %.3fs)" % (len(requests), duration, recorded_duration))
+    print("%d answers differ, p95 regressions: %s" % (len(mismatches), ", ".join(regressions) or "none"))
+    for mismatch in mismatches[:10]: print("    request %(request)d (%(op)s): %(difference)s" % mismatch)
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump({"trace": args.trace, "protocol": "binary" if binary else "text", "requests": len(requests),
+                "duration_s": duration, "unit": "ms", "operations": operations, "regressions": regressions,
+                "mismatches": mismatches}, f, indent=2)
+    sys.exit(1 if mismatches or regressions else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+#End to end checks of the text protocol against the mock engine
+#Usage: python -m unittest benchmarks/test_text_mode.py (the benchmark session runs if blender is in the PATH)
+import os
+import sys
+import shutil
+import socket
+import unittest
+import subprocess
+
+dir = os.path.dirname(os.path.abspath(__file__))
+
+#Text requests as written by utils.py
+def point_lines(points):
+    return "".join("%d\n%r\n%r\n" % (f, u, v) for f, u, v in points)
+
+def params_request(algorithm, subdivisions, precision = 0.1, parallel = True):
+    return "o%d\n%d\n%r\n%d\n" % (algorithm, subdivisions, precision, int(parallel))
+
+SEGMENT = [(1, 0.1, 0.2), (2, 0.3, 0.3), (3, 0.25, 0.5), (4, 0.0, 1.0)]
+
+class TextProtocolTest(unittest.TestCase):
+    def setUp(self):
+        self.engine = subprocess.Popen([sys.executable, os.path.join(dir, "mock_engine.py"), "mesh", "--port", "0"],
+            universal_newlines=True, stdout=subprocess.PIPE)
+        port = int(self.engine.stdout.readline().split()[1])
+        self.sock = socket.create_connection(("127.0.0.1", port))
+        self.sock.settimeout(5)
+        self.reader = self.sock.makefile('r')
+
+    def tearDown(self):
+        self.sock.sendall(b"a\n")
+        self.reader.close()
+        self.sock.close()
+        self.engine.wait(5)
+        self.engine.stdout.close()
+
+    def read_point(self):
+        f, u, v = self.reader.readline().split()
+        return int(f), float(u), float(v)
+
+    def read_polyline(self):
+        return [self.read_point() for i in range(int(self.reader.readline()))]
+
+    #Params and curve request merged in one packet, as after a level of detail change
+    def test_params_then_curve(self):
+        self.sock.sendall((params_request(0, 2) + point_lines(SEGMENT)).encode())
+        self.assertEqual(self.reader.readline(), "o\n")
+        curve = self.read_polyline()
+        self.assertEqual(len(curve), 3 * 2**2 + 1)
+        self.assertEqual(curve[0][0], SEGMENT[0][0])
+
+    def test_requests_back_to_back(self):
+        self.sock.sendall(("n\n" + point_lines(SEGMENT[:2]) + "l\n" + point_lines(SEGMENT[:2]) + "s\n0.5\n" + point_lines(SEGMENT)).encode())
+        self.assertEqual(self.read_point()[0], SEGMENT[0][0])
+        self.assertEqual(len(self.read_polyline()), 2)
+        self.assertEqual(len(self.read_polyline()), 7)
+
+@unittest.skipIf(shutil.which("blender") is None, "blender not in the PATH")
+class TextBenchmarkTest(unittest.TestCase):
+    def test_session(self):
+        args = ["blender", "--background", "--factory-startup", "--python", os.path.join(dir, "benchmark.py"), "--",
+            "--engine", "mock", "--text", "--drags", "20", "--sizes", "2"]
+        result = subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True, timeout=300)
+        self.assertEqual(result.returncode, 0, result.stdout)
+        self.assertIn("ico_2", result.stdout)
+
+if __name__ == "__main__":
+    unittest.main()
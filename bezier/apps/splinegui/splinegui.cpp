@@ -18,6 +18,8 @@
 
 #include <thread>
 #include <vector>
+#include <list>
+#include <unordered_map>
 #include <sstream>
 //using namespace std;
 
@@ -35,6 +37,8 @@ using namespace yocto;
 #include "playback.h"
 
 std::thread t1;
+bool binary_protocol = false; //Binary framed protocol with blender (--binary)
+int  server_port = DEFAULT_PORT; //Port for the blender connection (--port)
 
 void set_common_uniforms(const App& app, const ogl_program* program) {
   auto& view       = app.matrices.view;
@@ -1856,13 +1860,282 @@ int send_polyline(int ListenSocket, vector<mesh_point>& poly){
   return 0;
 }
 
+int send_point(int ListenSocket, const mesh_point& point){
+  std::string line =  std::to_string(point.face) + " " + std::to_string(point.uv.x) + " " + std::to_string(point.uv.y) + "\n";
+  send(ListenSocket, line.c_str(), line.length(), 0);
+  return 0;
+}
+
+//----------BLENDER REQUESTS (shared by text and binary protocol)----------
+
+//Memo of the 'n', 'r' and 'l' answers: the tangent handles are redrawn on every pick and mouse move
+//with mostly unchanged endpoints. The answers only depend on the mesh, fixed for the engine lifetime
+//Least recently used entries are dropped past MEMO_SIZE
+#define MEMO_SIZE 4096
+struct request_memo {
+  std::list<std::pair<std::string, vector<mesh_point>>> entries; //Most recently used first
+  std::unordered_map<std::string, decltype(entries)::iterator> index;
+};
+request_memo geodesic_memo;
+
+//Key of a request: opcode, flag and the bits of the first count points
+std::string memo_key(char op, int flag, const vector<mesh_point>& tmp, int count){
+  std::string key(2 + count * sizeof(mesh_point), '\0');
+  key[0] = op;
+  key[1] = (char)flag;
+  memcpy(&key[2], tmp.data(), count * sizeof(mesh_point));
+  return key;
+}
+
+const vector<mesh_point>* memo_get(request_memo& memo, const std::string& key){
+  auto it = memo.index.find(key);
+  if(it == memo.index.end()) return nullptr;
+  memo.entries.splice(memo.entries.begin(), memo.entries, it->second);
+  return &it->second->second;
+}
+
+void memo_put(request_memo& memo, const std::string& key, const vector<mesh_point>& answer){
+  memo.entries.emplace_front(key, answer);
+  memo.index[key] = memo.entries.begin();
+  if(memo.entries.size() > MEMO_SIZE){
+    memo.index.erase(memo.entries.back().first);
+    memo.entries.pop_back();
+  }
+}
+
+//Tangent extension of the curve: continue tmp[1]->tmp[0] beyond tmp[0]
+mesh_point tangent_extension(App& app, const vector<mesh_point>& tmp){
+  auto key = memo_key('n', 0, tmp, 2);
+  if(auto hit = memo_get(geodesic_memo, key)) return hit->front();
+  auto path = compute_geodesic_path(app.mesh, tmp[1], tmp[0]);
+  auto positions = path_positions(app.mesh, path);
+  float tan_len = path_length(positions);
+  auto end = continue_path(app.mesh, path, -tan_len).end;
+  memo_put(geodesic_memo, key, {end});
+  return end;
+}
+
+//Rotate the opposite tangent of the anchor tmp[1] (end selects which one)
+mesh_point rotate_tangent(App& app, const vector<mesh_point>& tmp, int end){
+  auto key = memo_key('r', end, tmp, 3);
+  if(auto hit = memo_get(geodesic_memo, key)) return hit->front();
+  geodesic_path result;
+  auto p1 = compute_geodesic_path(app.mesh, tmp[1], tmp[0]);
+  auto p2 = compute_geodesic_path(app.mesh, tmp[1], tmp[2]);
+  if(end == 0){
+    auto positions = path_positions(app.mesh, p1);
+    float tan_len = path_length(positions);
+    result = continue_path(app.mesh, p2, -tan_len);
+  }
+  else{
+    auto positions = path_positions(app.mesh, p2);
+    float tan_len = path_length(positions);
+    result = continue_path(app.mesh, p1, -tan_len);
+  }
+  memo_put(geodesic_memo, key, {result.end});
+  return result.end;
+}
+
+//Geodesic line between two points (control polygon)
+vector<mesh_point> straight_path(App& app, const vector<mesh_point>& tmp){
+  auto key = memo_key('l', 0, tmp, 2);
+  if(auto hit = memo_get(geodesic_memo, key)) return *hit;
+  auto path = compute_geodesic_path(app.mesh, tmp[0], tmp[1]);
+  auto points = path_positions_meshpoint(app.mesh, path);
+  memo_put(geodesic_memo, key, points);
+  return points;
+}
+
+//Eval point of a bezier segment for split
+mesh_point eval_split_point(App& app, const vector<mesh_point>& tmp, float t0){
+  bezier_segment polygon = bezier_segment{};
+  for (int i = 0; i < tmp.size(); ++i) polygon[i] = tmp[i];
+  return eval_bezier_point(app.mesh, polygon, t0, 0.f, 1.0f);
+}
+
+//Split bezier segment at t0, returns the 7 control points of the two halves
+vector<mesh_point> split_polygon(App& app, const vector<mesh_point>& tmp, float t0){
+  bezier_segment polygon = bezier_segment{};
+  for (int i = 0; i < tmp.size(); ++i) polygon[i] = tmp[i];
+  auto res = insert_point( app.mesh, polygon, t0);
+  vector<mesh_point> to_send; //Storing ouput points
+  for(int i = 0; i<4; i++) to_send.push_back( res[0][i] );
+  for(int i = 1; i<4; i++) to_send.push_back( res[1][i] );
+  return to_send;
+}
+
+//Calculate curve of a bezier segment from scratch
+vector<mesh_point> compute_curve(App& app, const vector<mesh_point>& tmp){
+  auto polygon = bezier_segment{};
+  for (int i = 0; i < tmp.size(); ++i) {
+    polygon[i] = tmp[i];
+  }
+  auto& params = app._bezier_params;
+  auto  points = vector<mesh_point>{};
+  switch (params.algorithm) {
+    case spline_algorithm::de_casteljau_adaptive:
+      points = bezier_adaptive(app.mesh, polygon, params);
+      break;
+    case spline_algorithm::de_casteljau_classic: {
+      auto badones = vector<int>{};
+      points = de_casteljau_classic(app.mesh, polygon, params, badones);
+    } break;
+    case spline_algorithm::subdivision_uniform:
+      points = spline_subdivision_uniform(app.mesh, polygon, params.subdivisions);
+      break;
+    case spline_algorithm::subdivision_adaptive:
+      points = spline_subdivision_adaptive(app.mesh, polygon, params);
+      break;
+    default: points = bezier_uniform(app.mesh, polygon, params);
+  }
+  return make_polyline_positions_meshpoints(app.mesh, points);
+}
+
+//Calculate the curves of several segments (4 control points each) in parallel
+vector<vector<mesh_point>> compute_curves(App& app, const vector<mesh_point>& tmp){
+  auto curves = vector<vector<mesh_point>>(tmp.size() / 4);
+  auto f = [&](int i) {
+    curves[i] = compute_curve(app, vector<mesh_point>(tmp.begin() + 4*i, tmp.begin() + 4*i + 4));
+  };
+  if(app._bezier_params.parallel) parallel_for((int)curves.size(), f);
+  else for(int i = 0; i < curves.size(); i++) f(i);
+  return curves;
+}
+
+void set_params(App& app, spline_algorithm algorithm, int subdivisions, float precision, bool parallel){
+  app._bezier_params.algorithm = algorithm;
+  app._bezier_params.subdivisions = subdivisions;
+  app._bezier_params.precision = precision;
+  app._bezier_params.parallel = parallel;
+}
+
+//----------BINARY WIRE PROTOCOL-------------------------------------------
+//Every message is a fixed header followed by header.size bytes of payload,
+//made of header.count packed point records (little endian, no padding)
+#pragma pack(push, 1)
+struct frame_header {
+  uint32_t size   = 0; //Payload size in bytes
+  char     op     = 0; //Request opcode (same letters of the text protocol, 'c' for curve, 'm' for batch of curves), 'e' answers an unknown request
+  uint8_t  flag   = 0; //Opcode argument: tangent end for 'r', algorithm for 'o'
+  uint16_t id     = 0; //Request id, echoed in the answer frames
+  int32_t  count  = 0; //Number of point records in the payload
+  double   param  = 0; //Scalar argument: t0 for 'p' and 's', subdivisions for 'o'
+};
+struct point_record {
+  int32_t face;
+  double  u;
+  double  v;
+};
+#pragma pack(pop)
+static_assert(sizeof(frame_header) == 20 && sizeof(point_record) == 20, "wire layout");
+
+//Read exactly len bytes, false if the peer closed the connection
+bool recv_all(int ClientSocket, void* data, size_t len){
+  auto buf = (char*)data;
+  while(len > 0){
+    auto n = recv(ClientSocket, buf, len, 0);
+    if(n <= 0) return false;
+    buf += n;
+    len -= n;
+  }
+  return true;
+}
+
+bool send_all(int ClientSocket, const void* data, size_t len){
+  auto buf = (const char*)data;
+  while(len > 0){
+    auto n = send(ClientSocket, buf, len, 0);
+    if(n <= 0) return false;
+    buf += n;
+    len -= n;
+  }
+  return true;
+}
+
+void append_frame(vector<char>& buffer, char op, const vector<mesh_point>& points, uint16_t id){
+  auto header = frame_header{};
+  header.op = op;
+  header.id = id;
+  header.count = points.size();
+  header.size = points.size() * sizeof(point_record);
+  auto offset = buffer.size();
+  buffer.resize(offset + sizeof(frame_header) + header.size);
+  memcpy(buffer.data() + offset, &header, sizeof(frame_header));
+  auto records = (point_record*)(buffer.data() + offset + sizeof(frame_header));
+  for(int i = 0; i < points.size(); i++){
+    records[i] = point_record{points[i].face, points[i].uv.x, points[i].uv.y};
+  }
+}
+
+//Send header and records in a single buffer
+bool send_frame(int ClientSocket, char op, const vector<mesh_point>& points, uint16_t id){
+  auto buffer = vector<char>{};
+  append_frame(buffer, op, points, id);
+  return send_all(ClientSocket, buffer.data(), buffer.size());
+}
+
+//Send one frame per polyline, all in a single buffer
+bool send_frames(int ClientSocket, char op, const vector<vector<mesh_point>>& polylines, uint16_t id){
+  auto buffer = vector<char>{};
+  for(auto& points : polylines) append_frame(buffer, op, points, id);
+  return send_all(ClientSocket, buffer.data(), buffer.size());
+}
+
+int listen_blender_binary(int ClientSocket, int ListenSocket, App& app){
+  auto header = frame_header{};
+  vector<point_record> records;
+  vector<mesh_point> tmp; //Storing input points
+  while(recv_all(ClientSocket, &header, sizeof(frame_header))){
+    if(header.count < 0 || header.size != header.count * sizeof(point_record)){
+      printf("malformed frame '%c' of %u bytes\n", header.op, header.size);
+      break;
+    }
+    records.resize(header.count);
+    if(!recv_all(ClientSocket, records.data(), header.size)) break;
+    tmp.resize(header.count);
+    for(int i = 0; i < header.count; i++){
+      tmp[i].face = records[i].face;
+      tmp[i].uv = vec2f{(float)records[i].u, (float)records[i].v};
+    }
+
+    switch(header.op){
+      //Close socket request
+      case 'a':
+        shutdown(ListenSocket, SHUT_RDWR);
+        std::cout<<"connention closed...\n";
+        return 0;
+      case 'n': send_frame(ClientSocket, 'n', {tangent_extension(app, tmp)}, header.id); break;
+      case 'r': send_frame(ClientSocket, 'r', {rotate_tangent(app, tmp, header.flag)}, header.id); break;
+      case 'l': send_frame(ClientSocket, 'l', straight_path(app, tmp), header.id); break;
+      case 'p': send_frame(ClientSocket, 'p', {eval_split_point(app, tmp, header.param)}, header.id); break;
+      case 's': send_frame(ClientSocket, 's', split_polygon(app, tmp, header.param), header.id); break;
+      //Algorithm in flag, subdivisions in param, optional record with parallel flag (face) and precision (u)
+      case 'o': 
+        if(header.count > 0) set_params(app, (spline_algorithm)header.flag, (int)header.param, (float)records[0].u, records[0].face != 0);
+        else set_params(app, (spline_algorithm)header.flag, (int)header.param, app._bezier_params.precision, app._bezier_params.parallel);
+        break;
+      case 'c': send_frame(ClientSocket, 'c', compute_curve(app, tmp), header.id); break;
+      //Batch of segments, answered with one 'c' frame per segment
+      case 'm': send_frames(ClientSocket, 'c', compute_curves(app, tmp), header.id); break;
+      //Unknown request, answered with an empty error frame so the client does not wait for it
+      default: 
+        printf("unknown request '%c'\n", header.op);
+        send_frame(ClientSocket, 'e', {}, header.id);
+    }
+  }
+  printf("Connection closing...\n");
+  close(ClientSocket);
+  shutdown(ListenSocket, SHUT_RDWR);
+  return 0;
+}
+
 int listen_blender(int ListenSocket, App& app){
     int ClientSocket;
     struct sockaddr_in address;
     int addrlen = sizeof(address);
     address.sin_family = AF_INET;
     address.sin_addr.s_addr = inet_addr("127.0.0.1");
-    address.sin_port = htons(DEFAULT_PORT);
+    address.sin_port = htons(server_port);
 
     //Ready for blender to connect
     std::cout << "waiting for client\n";
@@ -1873,6 +2146,7 @@ int listen_blender(int ListenSocket, App& app){
         perror("accept");
         exit(EXIT_FAILURE);
     }
+    if(binary_protocol) return listen_blender_binary(ClientSocket, ListenSocket, app);
 
     //Send and recv
     char recvbuf[DEFAULT_BUFLEN];
@@ -1897,37 +2171,17 @@ int listen_blender(int ListenSocket, App& app){
             std::istringstream str(std::string(recvbuf, iResult));
             std::getline(str, line); //Command line 'n', discard
             while(str) read_point_bar(str, tmp);
-            //Compute tangent
-            auto path = compute_geodesic_path(app.mesh, tmp[1], tmp[0]);
-            auto positions = path_positions(app.mesh, path);
-            float tan_len = path_length(positions);
-            auto tangent = continue_path(app.mesh, path, -tan_len);
             //Send new control point (Tangent extension)
-            line =  std::to_string(tangent.end.face) + " " + std::to_string(tangent.end.uv.x) + " " + std::to_string(tangent.end.uv.y) + "\n";
-            send(ClientSocket, line.c_str(), line.length(), 0);
+            send_point(ClientSocket, tangent_extension(app, tmp));
           //Rotate tangent
           }else if(recvbuf[0] == 'r'){
-            geodesic_path result;
             int end = 0;
             if(recvbuf[1] == '1') end = 1;
             std::istringstream str(std::string(recvbuf, iResult));
             std::getline(str, line); //Command line 'r', discard
             while(str) read_point_bar(str, tmp);
             //Compute path and send
-            auto p1 = compute_geodesic_path(app.mesh, tmp[1], tmp[0]);
-            auto p2 = compute_geodesic_path(app.mesh, tmp[1], tmp[2]);
-            if(end == 0){
-              auto positions = path_positions(app.mesh, p1);
-              float tan_len = path_length(positions);
-              result = continue_path(app.mesh, p2, -tan_len);
-            }
-            else{
-              auto positions = path_positions(app.mesh, p2);
-              float tan_len = path_length(positions);
-              result = continue_path(app.mesh, p1, -tan_len);
-            };
-            line =  std::to_string(result.end.face) + " " + std::to_string(result.end.uv.x) + " " + std::to_string(result.end.uv.y) + "\n";
-            send(ClientSocket, line.c_str(), line.length(), 0);
+            send_point(ClientSocket, rotate_tangent(app, tmp, end));
           }
           //Line for control polygon
           else if(recvbuf[0] == 'l'){
@@ -1935,71 +2189,52 @@ int listen_blender(int ListenSocket, App& app){
             std::getline(str, line); //Command line 'l', discard
             while(str) read_point_bar(str, tmp);
             //Compute path and send
-            auto path = compute_geodesic_path(app.mesh, tmp[0], tmp[1]);
-            auto res = path_positions_meshpoint(app.mesh, path);  
+            auto res = straight_path(app, tmp);
             send_polyline(ClientSocket, res);
           }
           //Eval point for split
            else if(recvbuf[0] == 'p'){
-            //vector<mesh_point> tmp;
             std::istringstream str(std::string(recvbuf, iResult));
-            std::getline(str, line); //Command line 'l', discard
+            std::getline(str, line); //Command line 'p', discard
             std::getline(str, line);
             float t0 = std::stof(line);
             while(str) read_point_bar(str, tmp);
-            bezier_segment polygon = bezier_segment{};
-            for (int i = 0; i < tmp.size(); ++i) polygon[i] = tmp[i];
-            mesh_point result = eval_bezier_point(app.mesh, polygon, t0, 0.f, 1.0f);
-            line =  std::to_string(result.face) + " " + std::to_string(result.uv.x) + " " + std::to_string(result.uv.y) + "\n";
-            send(ClientSocket, line.c_str(), line.length(), 0);
+            send_point(ClientSocket, eval_split_point(app, tmp, t0));
            }
           //split polygon
           else if(recvbuf[0] == 's'){
             std::istringstream str(std::string(recvbuf, iResult));  
-            std::getline(str, line); //Command line 'l', discard
+            std::getline(str, line); //Command line 's', discard
             std::getline(str, line); //t0
             float t0 = std::stof(line);
             while(str) read_point_bar(str, tmp);
-
-            bezier_segment polygon = bezier_segment{};
-            for (int i = 0; i < tmp.size(); ++i) {
-              polygon[i] = tmp[i];
-              std::cout<<"Polygon  f: " << tmp[i].face << " u: " << tmp[i].uv.x << " v: " << tmp[i].uv.y<< "\n";
-            }
-            
-            auto res = insert_point( app.mesh, polygon, t0);
-            vector<mesh_point> to_send; //Storing ouput points
-            //Print
-            //for(int i = 0; i<4; i++) std::cout<<"Segment 1  f: " << res[0][i].face << " u: " << res[0][i].uv.x << " v: " << res[0][i].uv.y<< "\n";
-            //for(int i = 0; i<4; i++) std::cout<<"Segment 2  f: " << res[1][i].face << " u: " << res[1][i].uv.x << " v: " << res[1][i].uv.y <<"\n";
-            //End print
-            for(int i = 0; i<4; i++) to_send.push_back( res[0][i] );
-            for(int i = 1; i<4; i++) to_send.push_back( res[1][i] );
-
+            auto to_send = split_polygon(app, tmp, t0);
             send_polyline(ClientSocket, to_send);
           }
           //Params
+          //Algorithm index (or 'd'/'s'), number of subdivisions, optional precision and parallel flag
           else if(recvbuf[0] == 'o'){
-            if(recvbuf[1] == 'd' ) app._bezier_params.algorithm = spline_algorithm::de_casteljau_uniform;
-            else  app._bezier_params.algorithm = spline_algorithm::subdivision_uniform;
+            auto algorithm = spline_algorithm::subdivision_uniform;
+            if(recvbuf[1] == 'd' ) algorithm = spline_algorithm::de_casteljau_uniform;
+            else if(isdigit(recvbuf[1])) algorithm = (spline_algorithm)(recvbuf[1] - '0');
             //Set subdivisions
             std::istringstream str(std::string(recvbuf, iResult));  
             std::getline(str, line); //Command line 'o', discard
             std::getline(str, line); //number of subdivision
-            int n = std::stoi(line);
-            app._bezier_params.subdivisions = n;
+            auto subdivisions = std::stoi(line);
+            auto precision = app._bezier_params.precision;
+            auto parallel = app._bezier_params.parallel;
+            if(std::getline(str, line) && line.size()) precision = std::stof(line);
+            if(std::getline(str, line) && line.size()) parallel = std::stoi(line) != 0;
+            set_params(app, algorithm, subdivisions, precision, parallel);
+            //Acknowledged, the client waits for it so the next request is not read with the params
+            send(ClientSocket, "o\n", 2, 0);
           }
           //Calculate curve from scratch
           else{
             std::istringstream str(std::string(recvbuf, iResult));
             while(str) read_point_bar(str, tmp); 
-            //Calculate curve
-            auto polygon = bezier_segment{};
-            for (int i = 0; i < tmp.size(); ++i) {
-              polygon[i] = tmp[i];
-            }
-            auto points = bezier_uniform(app.mesh, polygon, app._bezier_params);
-            auto res = make_polyline_positions_meshpoints(app.mesh, points);
+            auto res = compute_curve(app, tmp);
             // Send curve
             send_polyline(ClientSocket, res);
           }
@@ -2038,7 +2273,7 @@ int blender_connection(App& app) {
     //Create socket
     address.sin_family = AF_INET;
     address.sin_addr.s_addr = inet_addr("127.0.0.1");
-    address.sin_port = htons(DEFAULT_PORT);
+    address.sin_port = htons(server_port);
 
     
 
@@ -2055,6 +2290,15 @@ int blender_connection(App& app) {
         exit(EXIT_FAILURE);
     }
 
+    //Mesh loaded and socket bound: tell blender the port (a free one when --port 0)
+    socklen_t addrlen = sizeof(address);
+    if (getsockname(ListenSocket, (struct sockaddr*)&address, &addrlen) < 0) {
+        perror("getsockname");
+        exit(EXIT_FAILURE);
+    }
+    printf("ready %d\n", ntohs(address.sin_port));
+    fflush(stdout);
+
     t1 = std::thread(listen_blender, ListenSocket, std::ref(app));
     return 0;
 }
@@ -2069,6 +2313,9 @@ int main(int num_args, const char* args[]) {
   bool   log_colors = true;
   string playback   = "";
   int    msaa       = 1;
+  string cache_dir  = "";
+  string mesh_hash  = "";
+  int    cache_size = 256;
 
   auto cli = make_cli("bezier", "interactive viewer for mesh processing");
   add_option(cli, "mesh", app.filename, "Model filenames", true);
@@ -2080,10 +2327,23 @@ int main(int num_args, const char* args[]) {
   add_option(cli, "--colors/--no-colors", log_colors, "Colored logs");
   add_option(cli, "--msaa", msaa, "OpenGL multisample anti-aliasing");
   add_option(cli, "--playback", playback, "Playback recorded input session");
+  add_option(cli, "--binary", binary_protocol, "Binary framed protocol with blender");
+  add_option(cli, "--port", server_port, "Port for the blender connection, 0 for a free one");
+  add_option(cli, "--cache", cache_dir, "Precomputation cache directory");
+  add_option(cli, "--hash", mesh_hash, "Content hash of the mesh");
+  add_option(cli, "--cache-size", cache_size, "Cache size limit in MB");
   parse_cli(cli, num_args, args);
 
   // Load model and init bvh for fast click-intersection.
-  if (!load_mesh(app.filename, app.mesh, app.error)) print_fatal(app.error);
+  // Preprocessed meshes are reused from the cache, keyed by content hash.
+  auto cache_file = (cache_dir.empty() || mesh_hash.empty())
+                        ? ""s
+                        : cache_dir + "/" + mesh_hash + ".cache";
+  if (cache_file.empty() || !load_mesh_cache(cache_file, app.mesh)) {
+    if (!load_mesh(app.filename, app.mesh, app.error)) print_fatal(app.error);
+    if (!cache_file.empty() && save_mesh_cache(cache_file, app.mesh))
+      prune_mesh_cache(cache_dir, (size_t)cache_size * 1024 * 1024);
+  }
   //app.mesh.flipout  = new flipout::flipout_mesh{};
   // *app.mesh.flipout = make_flipout_mesh(app.mesh.triangles,
   // app.mesh.positions);
@@ -1,5 +1,9 @@
 #include "splineio.h"
 
+#include <algorithm>
+#include <filesystem>
+#include <functional>
+
 #include <yocto/yocto_commonio.h>
 
 #include "ext/json.hpp"
@@ -95,6 +99,11 @@ void init_mesh(bezier_mesh& mesh, bool with_opposite) {
 
 #include "stl_reader.h"
 
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+
 void load_mesh_stl(bezier_mesh& mesh, const string& filename) {
   std::vector<float>        coords, normals;
   std::vector<unsigned int> tris, solids;
@@ -152,6 +161,170 @@ void read_blender_obj(const string& filename, vector<vec3f>& positions, vector<v
       }*/
 }
 
+//Binary mesh exported by the blender add-on: magic "GMSH", number of
+//vertices and triangles (uint32), then float32 positions and int32 triangles
+bool parse_blender_bin(const char* data, size_t size, vector<vec3f>& positions, vector<vec3i>& triangles){
+  const size_t header = 4 + 2 * sizeof(uint32_t);
+  uint32_t num_positions = 0, num_triangles = 0;
+  if(size < header || std::string(data, 4) != "GMSH") return false;
+  memcpy(&num_positions, data + 4, sizeof(uint32_t));
+  memcpy(&num_triangles, data + 8, sizeof(uint32_t));
+  if(size < header + num_positions * sizeof(vec3f) + num_triangles * sizeof(vec3i)) return false;
+  auto first_position = (const vec3f*)(data + header);
+  auto first_triangle = (const vec3i*)(data + header + num_positions * sizeof(vec3f));
+  positions.assign(first_position, first_position + num_positions);
+  triangles.assign(first_triangle, first_triangle + num_triangles);
+  return true;
+}
+
+//Map file descriptor (file or shared memory) and parse its content in place
+bool read_mapped(int fd, const std::function<bool(const char*, size_t)>& parse){
+  struct stat info;
+  if(fd < 0) return false;
+  if(fstat(fd, &info) < 0 || info.st_size == 0){
+    close(fd);
+    return false;
+  }
+  auto data = mmap(nullptr, info.st_size, PROT_READ, MAP_SHARED, fd, 0);
+  close(fd);
+  if(data == MAP_FAILED) return false;
+  auto ok = parse((const char*)data, info.st_size);
+  munmap(data, info.st_size);
+  return ok;
+}
+
+bool read_blender_mapped(int fd, vector<vec3f>& positions, vector<vec3i>& triangles){
+  return read_mapped(fd, [&](const char* data, size_t size) {
+    return parse_blender_bin(data, size, positions, triangles);
+  });
+}
+
+bool read_blender_bin(const string& filename, vector<vec3f>& positions, vector<vec3i>& triangles){
+  return read_blender_mapped(open(filename.c_str(), O_RDONLY), positions, triangles);
+}
+
+//Mesh published by the add-on in a POSIX shared memory segment
+bool read_blender_shm(const string& name, vector<vec3f>& positions, vector<vec3i>& triangles){
+  return read_blender_mapped(shm_open(("/" + name).c_str(), O_RDONLY, 0), positions, triangles);
+}
+
+// -----------------------------------------------------------------------------
+// PRECOMPUTATION CACHE
+// -----------------------------------------------------------------------------
+
+//Preprocessed mesh (normalized positions, normals, adjacencies, dual solver)
+//stored by content hash so that a known mesh is not preprocessed again.
+//Layout: magic "GCCH", version, array sizes (uint32), then the arrays
+struct mesh_cache_header {
+  char     magic[4]           = {'G', 'C', 'C', 'H'};
+  uint32_t version            = 1;
+  uint32_t num_positions      = 0;
+  uint32_t num_triangles      = 0;
+  uint32_t num_dual_nodes     = 0;
+  uint32_t num_parent_faces   = 0;
+  int32_t  num_original_faces = 0;
+};
+
+bool load_mesh_cache(const string& filename, bezier_mesh& mesh) {
+  auto fd = open(filename.c_str(), O_RDONLY);
+  auto ok = read_mapped(fd, [&](const char* data, size_t size) {
+    auto header = mesh_cache_header{};
+    auto expected = mesh_cache_header{};
+    if (size < sizeof(header)) return false;
+    memcpy(&header, data, sizeof(header));
+    if (memcmp(header.magic, expected.magic, 4) != 0 ||
+        header.version != expected.version)
+      return false;
+    using dual_node = array<dual_geodesic_solver::edge, 3>;
+    auto required = sizeof(header) +
+                    header.num_positions * 2 * sizeof(vec3f) +
+                    header.num_triangles * 2 * sizeof(vec3i) +
+                    header.num_dual_nodes * sizeof(dual_node) +
+                    header.num_parent_faces * sizeof(int);
+    if (size != required) return false;
+    auto offset = sizeof(header);
+    auto read_array = [&](auto& values, size_t count) {
+      using T = typename std::decay_t<decltype(values)>::value_type;
+      auto first = (const T*)(data + offset);
+      values.assign(first, first + count);
+      offset += count * sizeof(T);
+    };
+    mesh = bezier_mesh{};
+    read_array(mesh.positions, header.num_positions);
+    read_array(mesh.normals, header.num_positions);
+    read_array(mesh.triangles, header.num_triangles);
+    read_array(mesh.adjacencies, header.num_triangles);
+    read_array(mesh.dual_solver.graph, header.num_dual_nodes);
+    read_array(mesh.dual_solver.parent_faces, header.num_parent_faces);
+    mesh.dual_solver.num_original_faces = header.num_original_faces;
+    return true;
+  });
+  if (!ok) return false;
+  //Mark as recently used for the eviction
+  auto error = std::error_code{};
+  std::filesystem::last_write_time(
+      filename, std::filesystem::file_time_type::clock::now(), error);
+  printf("%s: mesh has %ld  triangle\n", __FUNCTION__, mesh.triangles.size());
+  return true;
+}
+
+bool save_mesh_cache(const string& filename, const bezier_mesh& mesh) {
+  auto header               = mesh_cache_header{};
+  header.num_positions      = (uint32_t)mesh.positions.size();
+  header.num_triangles      = (uint32_t)mesh.triangles.size();
+  header.num_dual_nodes     = (uint32_t)mesh.dual_solver.graph.size();
+  header.num_parent_faces   = (uint32_t)mesh.dual_solver.parent_faces.size();
+  header.num_original_faces = mesh.dual_solver.num_original_faces;
+  if (mesh.normals.size() != mesh.positions.size() ||
+      mesh.adjacencies.size() != mesh.triangles.size())
+    return false;
+
+  //Write next to the final file and rename, concurrent engines never read a partial cache
+  auto tmpname = filename + ".tmp" + std::to_string(getpid());
+  auto fs      = fopen(tmpname.c_str(), "wb");
+  if (!fs) return false;
+  auto ok          = fwrite(&header, sizeof(header), 1, fs) == 1;
+  auto write_array = [&](const auto& values) {
+    using T = typename std::decay_t<decltype(values)>::value_type;
+    if (ok && !values.empty())
+      ok = fwrite(values.data(), sizeof(T), values.size(), fs) == values.size();
+  };
+  write_array(mesh.positions);
+  write_array(mesh.normals);
+  write_array(mesh.triangles);
+  write_array(mesh.adjacencies);
+  write_array(mesh.dual_solver.graph);
+  write_array(mesh.dual_solver.parent_faces);
+  ok = (fclose(fs) == 0) && ok;
+  if (!ok || rename(tmpname.c_str(), filename.c_str()) != 0) {
+    remove(tmpname.c_str());
+    return false;
+  }
+  return true;
+}
+
+//Remove the least recently used cache files until the directory fits max_bytes
+void prune_mesh_cache(const string& directory, size_t max_bytes) {
+  namespace fs = std::filesystem;
+  auto error   = std::error_code{};
+  auto entries = vector<fs::directory_entry>{};
+  auto total   = (size_t)0;
+  for (auto& entry : fs::directory_iterator(directory, error)) {
+    if (!entry.is_regular_file(error) || entry.path().extension() != ".cache")
+      continue;
+    entries.push_back(entry);
+    total += entry.file_size(error);
+  }
+  std::sort(entries.begin(), entries.end(), [&](auto& a, auto& b) {
+    return a.last_write_time(error) < b.last_write_time(error);
+  });
+  for (auto& entry : entries) {
+    if (total <= max_bytes) break;
+    auto size = entry.file_size(error);
+    if (fs::remove(entry.path(), error)) total -= size;
+  }
+}
+
 bool load_mesh(const string& filename, bezier_mesh& mesh, string& error) {
   mesh = bezier_mesh{};
 
@@ -175,8 +348,18 @@ bool load_mesh(const string& filename, bezier_mesh& mesh, string& error) {
 #else
 
   auto ext = path_extension(filename);
-  if (ext == ".stl") {
+  if (filename.rfind("shm:", 0) == 0) {
+    if (!read_blender_shm(filename.substr(4), mesh.positions, mesh.triangles)) {
+      error = filename + ": cannot read shared memory mesh";
+      return false;
+    }
+  } else if (ext == ".stl") {
     load_mesh_stl(mesh, filename);
+  } else if (ext == ".bin") {
+    if (!read_blender_bin(filename, mesh.positions, mesh.triangles)) {
+      error = filename + ": corrupted binary mesh";
+      return false;
+    }
   } else {
     /*if (!load_shape(filename, points, lines, mesh.triangles, quads, quadspos,
             quadsnorm, quadstexcoord, mesh.positions, normals, mesh.texcoords,
@@ -4,6 +4,11 @@
 
 bool load_mesh(const string& filename, bezier_mesh& mesh, string& error);
 
+// Preprocessed meshes cached on disk by content hash
+bool load_mesh_cache(const string& filename, bezier_mesh& mesh);
+bool save_mesh_cache(const string& filename, const bezier_mesh& mesh);
+void prune_mesh_cache(const string& directory, size_t max_bytes);
+
 bool load_bezier_params(const string& filename, vector<mesh_point>& points,
     bezier_params& params, string& error);
 bool save_bezier_params(const string& filename,
@@ -1,43 +1,86 @@
 import sys
 import os
 import bpy
+import time
 import numpy as np
 
 from bpy_extras import view3d_utils
 from mathutils import Vector
 from mathutils.interpolate import poly_3d_calc
 
-dir = os.path.dirname(bpy.context.space_data.text.filepath) #Get directory of the .py file
+if bpy.context.space_data is not None: dir = os.path.dirname(bpy.context.space_data.text.filepath) #Get directory of the .py file
+else: dir = os.path.dirname(os.path.abspath(__file__)) #Imported by a script (benchmarks)
 sys.path.append(dir) #Setting it as the python directory in the Blender Text editor
 
 import utils
 import spline
+import profiling
+import overlay
 
-def create_poly(obj_name, color, bevel = 0.01):
-    data = bpy.data.curves.new(name=obj_name+'_data', type='CURVE')  
-    data.dimensions = '3D'  
-
-    obj_tan = bpy.data.objects.new(obj_name, data)
-    obj_tan[utils.key_name] = "t"  
-    bpy.context.view_layer.active_layer_collection.collection.objects.link(obj_tan)
-
-    data.splines.new('POLY')
+#Engine requests of a drag position: curve segments and tangent rotations
+class DragRequest:
+    def __init__(self, curve):
+        self.curve = curve #Segment keys, requested keys, future of the polylines
+        self.rotations = [] #(index of the rotated point, future of the new point)
+        
+    def done(self):
+        return self.curve[2].done() and all(future.done() for _, future in self.rotations)
 
-    material = bpy.data.materials.new("polygon_material")
-    material.diffuse_color = color
-    data.materials.append(material)
-    data.bevel_depth = bevel
-    return obj_tan
+#Undo history of an editing session
+#A step keeps the changed range of the control points (point records before and after), the curve flags
+#and the selected point, the global undo step is pushed once when the session ends
+class UndoHistory:
+    def __init__(self, points_bar, curve_item, curr_idx):
+        self.steps = [] #(start, records before, records after, state before, state after)
+        self.pos = 0 #Steps applied, the following ones can be redone
+        self.records = points_bar.records()
+        self.state = (curve_item.is_closed, curve_item.smooth, curr_idx)
+        
+    #Record the changes since the last step
+    def push(self, points_bar, curve_item, curr_idx):
+        records = points_bar.records()
+        state = (curve_item.is_closed, curve_item.smooth, curr_idx)
+        start, before, after = changed_range(self.records, records)
+        if len(before) == 0 and len(after) == 0 and state == self.state: return
+        del self.steps[self.pos:]
+        self.steps.append((start, before, after, self.state, state))
+        self.pos += 1
+        self.records = records
+        self.state = state
+        
+    #Output: selected point of the restored state, None if there is nothing to undo
+    def undo(self, points_bar, curve_item):
+        if self.pos == 0: return None
+        self.pos -= 1
+        start, before, after, state, _ = self.steps[self.pos]
+        return self.apply(points_bar, curve_item, start, len(after), before, state)
+        
+    def redo(self, points_bar, curve_item):
+        if self.pos == len(self.steps): return None
+        start, before, after, _, state = self.steps[self.pos]
+        self.pos += 1
+        return self.apply(points_bar, curve_item, start, len(before), after, state)
+    
+    def apply(self, points_bar, curve_item, start, count, records, state):
+        points_bar.replace(start, count, records)
+        curve_item.is_closed, curve_item.smooth, curr_idx = state
+        self.records = points_bar.records()
+        self.state = state
+        return curr_idx
+    
+    #Changes not in the global undo history yet
+    def changed(self):
+        return self.pos > 0
 
-def rotate_tan(p0, p1, p2, end):
-    send = "r" + str(end) + "\n"
-    send += utils.pbar2str( p0 ) 
-    send += utils.pbar2str( p1 ) 
-    send += utils.pbar2str( p2 ) 
-    try: spline.comm.s.sendall(send.encode())
-    except: return False
-    new_control = spline.comm.s.recv(2048).decode().splitlines()[0].split()
-    return [int(new_control[0]), [float(new_control[1]), float(new_control[2])]]
+#Output: start of the range of differing point records, records of the range in a and in b
+def changed_range(a, b):
+    n = min(len(a), len(b))
+    diff = a[:n] != b[:n]
+    start = int(np.argmax(diff)) if diff.any() else n
+    m = n - start
+    diff = a[len(a)-m:][::-1] != b[len(b)-m:][::-1]
+    end = int(np.argmax(diff)) if diff.any() else m #Common points at the end
+    return start, a[start:len(a)-end].copy(), b[start:len(b)-end].copy()
 
 def print_debug():
     print("_________________")
@@ -47,90 +90,412 @@ def print_debug():
         print(item.key, " ", len( item.value ), " curves" )
         for curve_idx, info in enumerate(item.value):
             print("\tcurve_idx: ", curve_idx)
-            for p in info.points_bar:
-                print("\t\t", p.get())
+            points_bar = utils.ControlPoints(info)
+            for i in range(len(points_bar)):
+                print("\t\t", points_bar.get(i))
             print("is_closed: ", info.is_closed)
     print("_________________\n\n")
     return 
 
 bpy.types.Scene.curr_idx  = bpy.props.IntProperty(default=-1) # For editing
+LOD_IDLE_TIME = 0.3 #Seconds of a still mouse during drag before refining the curve
 is_running = False
 
-class EditCurveOperator(bpy.types.Operator):
+#Editing of a spline on its target object, shared by EditCurveOperator and the benchmark sessions
+#Subclasses set curve_key and define report and invalidate_target (called when the engine fails)
+class CurveEditing:
+    def __init__(self):
+        curve_item = None
+        points_bar = None
+        target = None
+        curve = None
+        self.overlay = overlay.Overlay() #Tangent handles, pickable anchors and split point
+        self.t0 = 0.1
+        
+        #Evaluated polyline (world coords) of each segment, keyed by subdivision level and its 4 control points
+        self.segment_cache = {}
+        self.curve_keys = [] #Cache keys of the segments of the drawn curve, in order
+        self.arc_table = None #Arc length of the drawn curve, for the split point
+        self.subdivisions = None #Subdivision level set on the engine, coarser while dragging
+    
+    def init_refs(self):
+        #Set curve pointer
+        self.curve = utils.getObjByKey(self.curve_key)
+        geo_key = self.curve[utils.key_name]
+        #Set target pointer
+        idx = geo_key.find('o')
+        curve_idx = int(geo_key[1:idx])
+        obj_key = geo_key[idx:]
+        target = utils.getObjByKey(obj_key)
+        if target is None:
+            self.report({'WARNING'}, "Curve invalidated since the geometry has been modified")
+            return False 
+        self.target = target
+        #Set curve info
+        self.curve_item = utils.obj_curves_get(obj_key).value[curve_idx]
+        self.points_bar = utils.ControlPoints(self.curve_item)
+        return True
+    
+    #Cache key of the curve of a segment at the current level, from the bytes of its point records
+    def segment_cache_key(self, segment):
+        return (self.subdivisions, utils.point_records(segment).tobytes())
+    
+    #Move the selected control point and send the engine requests, curve and tangent rotations overlap
+    #Output: requests in flight
+    def move_point(self, context, new_point):
+        idx = context.scene.curr_idx
+        self.points_bar.set(idx, new_point)
+                    
+        #Closed curve cases
+        if self.curve_item.is_closed and idx == 0:
+            self.points_bar.set(idx-1, new_point)
+            
+        if self.curve_item.is_closed and idx == len(self.points_bar) - 1:
+            self.points_bar.set(0, new_point)
+             
+        request = DragRequest(self.request_curve())
+        #Update tangents
+        if self.curve_item.smooth:
+            if idx % 3 == 1 and (idx > 1 or self.curve_item.is_closed):
+                p1 = idx-2
+                p2 = idx-1
+                p3 = idx
+                if idx == 1: p1 = len(self.points_bar) -2 
+                request.rotations.append((p1, utils.request_rotate_tan(spline.comm.s, *self.points_bar.points((p1, p2, p3)), 0)))
+                
+            if idx%3==2 and (idx<len(self.points_bar)-2 or self.curve_item.is_closed):
+                p1 = idx
+                p2 = idx+1
+                p3 = idx+2
+                if idx == len(self.points_bar) -2: p3 = 1
+                request.rotations.append((p3, utils.request_rotate_tan(spline.comm.s, *self.points_bar.points((p1, p2, p3)), 1)))
+        return request
+    
+    #Draw the answers of a drag position
+    @profiling.timed("edit apply_drag")
+    def apply_drag(self, context, request):
+        if not self.apply_curve(request.curve): return False
+        for idx, future in request.rotations:
+            try: self.points_bar.set(idx, future.result(utils.ENGINE_TIMEOUT))
+            except:
+                self.invalidate_target()
+                return False
+        return self.draw_tan(context)
+    
+    #Add a segment from the last anchor to new_point, its first tangent continues the last one of the curve
+    @profiling.timed("edit extend")
+    def extend(self, context, new_point):
+        try: 
+            utils.send_tan_extension(spline.comm.s, self.points_bar.get(-2), self.points_bar.get(-1))
+            new_bar = utils.recv_point(spline.comm.s)
+        except:
+            self.invalidate_target()
+            return False
+        new_points_bar = [self.points_bar.get(-1), new_bar, new_point, new_point]
+        return self.add_curve(context, new_points_bar)
+    
+    #Close the spline with a segment from the last anchor to the first one
+    @profiling.timed("edit close_curve")
+    def close_curve(self, context):
+        start = self.points_bar.get(0)
+        end   = self.points_bar.get(-1)
+        #Check if already overlapping 
+        if start[0] != end[0] or start[1][0] != end[1][0] or start[1][1] != end[1][1]:  
+            if self.curve_item.smooth:
+                #Extension 1
+                try:
+                    utils.send_tan_extension(spline.comm.s, self.points_bar.get(1), self.points_bar.get(0))
+                    new_bar_1 = utils.recv_point(spline.comm.s)
+                except:
+                    self.invalidate_target()
+                    return False
+                #extension 2
+                try:
+                    utils.send_tan_extension(spline.comm.s, self.points_bar.get(-2), self.points_bar.get(-1))
+                    new_bar_2 = utils.recv_point(spline.comm.s)
+                except:
+                    self.invalidate_target()
+                    return False
+                new_points_bar = [self.points_bar.get(-1), new_bar_2, new_bar_1, self.points_bar.get(0)]
+            else: new_points_bar = self.points_bar.points([-1, -1, 0, 0])
+            if not self.add_curve(context, new_points_bar): return False
+        self.curve_item.is_closed = True
+        return True
+    
+    #Split point shown at t0, the arc length of the drawn segments sizes the split_arc_length steps
+    def start_split(self):
+        self.arc_table = utils.ArcLengthTable([self.segment_cache[key] for key in self.curve_keys])
+        return self.draw_t0()
+    
+    #Move the split point by steps wheel ticks, along the segments or by arc length of the whole curve
+    def move_t0(self, context, steps):
+        step = steps * context.scene.split_step
+        if context.scene.split_arc_length: 
+            self.t0 = self.arc_table.param(self.arc_table.arc_length(self.t0) + step * self.arc_table.total)
+        else: self.t0 = min(max(self.t0 + step, 0.0), len(self.arc_table.segments))
+    
+    #Output: first control point of the segment of t0 and the bezier parameter in the segment
+    def split_param(self):
+        anchor = int(self.t0) * 3
+        t0_loc = self.t0 - int(self.t0)
+        if anchor == len(self.points_bar) - 1: 
+            anchor -= 3
+            t0_loc = 1 
+        return anchor, t0_loc
+    
+    #Split point placed on the drawn segment, the engine is only asked for the split itself
+    #Uniform algorithms sample the segment evenly in the parameter, the others are interpolated by arc length
+    @profiling.timed("edit draw_t0")
+    def draw_t0(self):
+        anchor, t0_loc = self.split_param()
+        i = anchor // 3
+        if bpy.context.scene.algorithm in utils.UNIFORM_ALGORITHMS:
+            points = self.arc_table.segments[i]
+            coord = utils.polyline_point(points, t0_loc * (len(points) - 1))
+        else: coord = self.arc_table.point_at(i, t0_loc)
+        self.overlay.set_split_point(coord)
+        return True
+    
+    def draw_pickable(self, context):
+        pickable = range(0, len(self.points_bar), 3) 
+        #Closed curve case
+        if self.curve_item.is_closed and (context.scene.curr_idx == 0 or context.scene.curr_idx == len(self.points_bar)-1): 
+            pickable = range(3, len(self.points_bar)-1, 3)
+        shown = []
+        for i in pickable:
+            if i !=  context.scene.curr_idx: 
+                #Overlapping check
+                if i > context.scene.curr_idx:
+                    p1 = self.points_bar.get(context.scene.curr_idx)
+                    p2 = self.points_bar.get(i)
+                    if p1[0] == p2[0] and p1[1][0] == p2[1][0] and p1[1][1] == p2[1][1]: continue  
+                shown.append(i)
+        #Calculate 3d points in one batch
+        self.overlay.set_anchors(utils.convert_coords(self.target, self.points_bar.records()[shown]))
+        
+        
+    @profiling.timed("edit split")
+    def split(self, context):
+        #Send request
+        anchor, t0_loc = self.split_param()
+        points_bar = self.points_bar.points(range(anchor, anchor + 4))
+        try: utils.send_split(spline.comm.s, points_bar, t0_loc)
+        except:
+            self.invalidate_target()
+            return False
+        new_points, _ = utils.recv_points(spline.comm.s)
+        #The 4 points of the segment are replaced by the 7 of the two new segments
+        self.points_bar.replace(anchor, 4, np.asarray(new_points, dtype=utils.POINT_DTYPE))
+            
+        context.scene.curr_idx = anchor + 3
+        return True
+    
+    @profiling.timed("edit draw_curve")
+    def draw_curve(self):
+        try: request = self.request_curve()
+        except:
+            self.invalidate_target()
+            return False
+        return self.apply_curve(request)
+    
+    #Send one request for the segments whose control points changed
+    #Output: segment keys, keys of the requested segments, future of their polylines
+    @profiling.timed("edit request_curve")
+    def request_curve(self):
+        records = self.points_bar.records()
+        segments = [records[i:i+4] for i in range(0, len(records) - 1, 3)]
+        keys = [self.segment_cache_key(segment) for segment in segments]
+        #Only segments whose control points changed are evaluated again, all in one request
+        missing = {}
+        for key, segment in zip(keys, segments):
+            if key not in self.segment_cache: missing[key] = segment
+        return keys, list(missing.keys()), utils.request_curves(spline.comm.s, list(missing.values()))
+    
+    #Draw the curve once the requested segments are answered
+    @profiling.timed("edit apply_curve")
+    def apply_curve(self, request):
+        keys, missing, future = request
+        try: curves = utils.curves_to_world(self.target, future.result(utils.ENGINE_TIMEOUT))
+        except:
+            self.invalidate_target()
+            return False
+        cache = dict(zip(missing, curves))
+        coords = []
+        for i, key in enumerate(keys):
+            curve_seg = cache.get(key)
+            if curve_seg is None: curve_seg = cache[key] = self.segment_cache[key]
+            #Segments share the end points, first point only for the first segment
+            if i == 0: coords.append(curve_seg)
+            else: coords.append(curve_seg[1:])
+        #Keep only the segments of the current spline
+        self.segment_cache = cache
+        self.curve_keys = keys
+        poly = self.curve.data.splines.new('POLY')
+        utils.set_poly_points(poly, np.concatenate(coords))
+        self.curve.data.splines.remove( self.curve.data.splines[0] )
+        return True
+    
+    @profiling.timed("edit draw_tan")
+    def draw_tan(self, context):
+        tan_1 = []
+        tan_2 = []
+        
+        idx = context.scene.curr_idx #Closest anchor point
+        if idx % 3 == 1: idx -= 1
+        if idx % 3 == 2: idx += 1
+        
+        #Both paths requested before waiting for the first one
+        path_1 = path_2 = None
+        try:
+            if idx > 0 or self.curve_item.is_closed:
+                p1 = idx-1
+                p2 = idx
+                if idx == 0: p1 = len(self.points_bar) -2
+                path_1 = utils.request_straight_path(spline.comm.s, self.points_bar.get(p1), self.points_bar.get(p2))
+            if idx < len(self.points_bar) - 2 or self.curve_item.is_closed:
+                p1 = idx
+                p2 = idx+1
+                if idx == len(self.points_bar) -1: p2 = 1
+                path_2 = utils.request_straight_path(spline.comm.s, self.points_bar.get(p1), self.points_bar.get(p2))
+            if path_1 is not None: tan_1 = utils.convert_coords(self.target, path_1.result(utils.ENGINE_TIMEOUT))
+            if path_2 is not None: 
+                tan_2 = utils.convert_coords(self.target, path_2.result(utils.ENGINE_TIMEOUT))
+                #Anchor shared with the first tangent
+                if len(tan_1) > 0: tan_2 = tan_2[1:]
+        except:
+            self.invalidate_target()
+            return False
+        #Both tangents in one polyline, only anchor and tangent ends marked
+        coords = np.concatenate([t for t in (tan_1, tan_2) if len(t) > 0])
+        markers = [0, len(coords) - 1]
+        if len(tan_1) > 0: markers.append(len(tan_1) - 1)
+        #Selected point
+        if context.scene.curr_idx % 3 == 2: to_select = 0
+        if context.scene.curr_idx % 3 == 1: to_select = len(coords) - 1
+        if context.scene.curr_idx % 3 == 0:
+            if   len(tan_1) == 0: to_select = 0
+            else: to_select = len(tan_1) - 1   
+        self.overlay.set_handles(coords, markers, to_select)
+        #Draw other pickable objects first
+        try: self.draw_pickable(context)
+        except:
+            self.invalidate_target()
+            return False
+        
+        return True
+    
+    @profiling.timed("edit delete_segment")
+    def delete_segment(self, context):
+        if len(self.points_bar) == 4: 
+            self.report({'WARNING'}, "Only one segment present") 
+            return
+        idx = context.scene.curr_idx #Closest anchor point
+        if idx % 3 == 1: idx -= 1
+        if idx % 3 == 2: idx += 1
+        
+        if idx == 0: idx = 1
+        if idx == len(self.points_bar) - 1: 
+            idx -= 1
+            context.scene.curr_idx -= 3
+        
+        self.points_bar.remove(idx - 1, 3)
+        
+        if context.scene.curr_idx > len(self.points_bar) - 1:
+            context.scene.curr_idx = len(self.points_bar) - 1
+        
+    @profiling.timed("edit add_curve")
+    def add_curve(self, context, new_points_bar):
+        self.points_bar.append(new_points_bar[1:])
+        #Calculate additional curve and draw
+        try: curve = utils.get_curve(spline.comm.s, self.target, new_points_bar)
+        except:
+            self.invalidate_target()
+            return False
+        key = self.segment_cache_key(new_points_bar)
+        self.segment_cache[key] = curve
+        self.curve_keys.append(key)
+        poly_line = self.curve.data.splines[0]
+        coords = np.concatenate((utils.get_poly_points(poly_line), curve[1:]))
+        utils.set_poly_points(poly_line, coords)
+        context.scene.curr_idx = len(self.points_bar) - 1
+        return True
+    
+class EditCurveOperator(bpy.types.Operator, CurveEditing):
     """Pick control point"""
     bl_idname = "view3d.edit_curve"
     bl_label = "Edit bezier spline"
     bl_options = {'REGISTER'}
     
     def __init__(self):
+        CurveEditing.__init__(self)
         self.curve_key = None #For restoring on undo
-        curve_item = None
-        points_bar = None
-        target = None
-        curve = None
-        tan = None
         
         self.clicking = False
         self.drag     = False
+        self.drag_coord = None #Latest drag position not processed yet
+        self.drag_time  = 0 #Time of the last processed drag position
+        self.drag_timer = None #Flushes the pending drag position
+        self.drag_request = None #Engine requests of the drag position in flight
         
         self.split_mode = False
-        self.t0 = 0.1
+        
+        self.pick_index = utils.PickIndex() #Screen positions of the control points
+        self.history = None #Undo history of the session
+        self.ready = None #Engine startup
+        self.timer = None #Polls the engine startup
 
     def modal(self, context, event):
-        global is_running
+        #Engine still loading, keep the viewport responsive
+        if self.timer is not None:
+            if event.type == 'ESC': return self.finish(context, {'CANCELLED'})
+            if event.type != 'TIMER' or not self.ready.done(): return {'PASS_THROUGH'}
+            self.stop_timer(context)
+            if not self.start(context): return self.finish(context, {'CANCELLED'})
+            return {'RUNNING_MODAL'}
         #Scene navigation, zoom pan and rotate camera
         if event.type in {'MIDDLEMOUSE', 'WHEELUPMOUSE', 'WHEELDOWNMOUSE'} and not event.ctrl:
             return {'PASS_THROUGH'} # allow navigation
         elif event.type == 'Z' and event.value == 'RELEASE' and event.ctrl:
-            #Redo
-            if event.shift: 
-                try: bpy.ops.ed.redo()
-                except: return {'RUNNING_MODAL'}   
-            #Undo
-            else: bpy.ops.ed.undo()
             self.split_mode = False
             self.t0 = 0.1
-            tan = utils.getObjByKey("t")
-            if tan is None:
-                self.report({'WARNING'}, "Exiting editing mode")
-                is_running = False
-                return {'FINISHED'}
-            self.init_refs()
-            bpy.context.view_layer.objects.active = self.tan
-            bpy.ops.object.mode_set(mode = 'EDIT') 
-            if not self.draw_curve(): return {'FINISHED'} 
-            if not self.draw_tan(context):   return {'FINISHED'}
+            #Steps of the session, only the segments that changed are evaluated again
+            if event.shift: curr_idx = self.history.redo(self.points_bar, self.curve_item)
+            else: curr_idx = self.history.undo(self.points_bar, self.curve_item)
+            if curr_idx is not None:
+                context.scene.curr_idx = curr_idx
+                if not self.draw_curve(): return self.finish(context) 
+                if not self.draw_tan(context):   return self.finish(context)
+                return {'RUNNING_MODAL'}
+            if event.shift: return {'RUNNING_MODAL'}
+            #Global undo history, before the session
+            self.finish(context)
+            bpy.ops.ed.undo()
+            self.report({'WARNING'}, "Exiting editing mode")
+            return {'FINISHED'}
         #Exit
         elif event.type == 'ESC':
-            bpy.data.objects.remove(self.tan, do_unlink=True)
-            is_running = False
-            return {'FINISHED'}
+            return self.finish(context)
 
         #Split mode functions
         elif self.split_mode:
             if event.type == 'WHEELUPMOUSE' and event.ctrl:
-                n_splines = (len(self.points_bar) - 1)/3
-                if self.t0 < n_splines: 
-                    self.t0 = self.t0 + 0.1
-                    self.t0 = round(self.t0,1)
-                if not self.draw_t0(): return {'FINISHED'}
+                self.move_t0(context, 1)
+                if not self.draw_t0(): return self.finish(context)
             elif event.type == 'WHEELDOWNMOUSE' and event.ctrl:
-                if self.t0 > 0: 
-                    self.t0 = self.t0 - 0.1
-                    self.t0 = round(self.t0,1)
-                if not self.draw_t0(): return {'FINISHED'}
+                self.move_t0(context, -1)
+                if not self.draw_t0(): return self.finish(context)
             elif event.type == 'LEFTMOUSE' and event.value == 'RELEASE':
-                if not self.split(context): return {'FINISHED'} 
+                if not self.split(context): return self.finish(context) 
                 self.split_mode = False
                 self.t0 = 0.1
                 self.report({'INFO'}, "Splitted")
-                if not self.draw_curve(): return {'FINISHED'}
-                if not self.draw_tan(context): return {'FINISHED'} 
+                if not self.draw_curve(): return self.finish(context)
+                if not self.draw_tan(context): return self.finish(context) 
                 self.push_state()
             elif event.type== 'S' and event.value== 'RELEASE':
                 self.split_mode = False
                 context.scene.curr_idx = 0
-                if not self.draw_tan(context): return {'FINISHED'}
+                if not self.draw_tan(context): return self.finish(context)
                 self.report({'INFO'}, "Exit split mode")
             return {'RUNNING_MODAL'}
         #Normal editing operations       
@@ -140,22 +505,26 @@ class EditCurveOperator(bpy.types.Operator):
                 self.clicking = False
                 if self.drag:
                     self.drag = False
+                    self.stop_drag_timer(context)
+                    if not self.update_drag(context, wait=True): return self.finish(context)
+                    #Final density for the released curve
+                    if not self.set_lod(context, False): return self.finish(context)
                     self.push_state()
                     return {'RUNNING_MODAL'}
                 #If was not dragging pick
-                hit_obj, loc, normal, face_index = utils.ray_cast(context, event)
+                hit_obj, loc, normal, face_index = utils.ray_cast(context, event, target=self.target)
                 if not hit_obj: return {'RUNNING_MODAL'}
                 hit_obj = bpy.context.scene.objects[hit_obj.name] #Get evaluated object
                 if utils.key_name in hit_obj and hit_obj[utils.key_name] == self.target[utils.key_name]:
                     #Correct object hit
                     coord = event.mouse_region_x, event.mouse_region_y
-                    if not self.pick(context, coord): return {'FINISHED'}  
-                    if not self.draw_tan(context): return {'FINISHED'}
+                    if not self.pick(context, coord): return self.finish(context)  
+                    if not self.draw_tan(context): return self.finish(context)
                     self.push_state()
             return {'RUNNING_MODAL'}
         #Add bezier segment
         elif event.type == 'RIGHTMOUSE' and event.value == 'RELEASE':
-            hit_obj, loc, normal, face_index = utils.ray_cast(context, event)
+            hit_obj, loc, normal, face_index = utils.ray_cast(context, event, target=self.target)
             if not hit_obj: return {'RUNNING_MODAL'}
             hit_obj = bpy.context.scene.objects[hit_obj.name]
             if utils.key_name in hit_obj and hit_obj[utils.key_name] == self.target[utils.key_name]:
@@ -169,72 +538,21 @@ class EditCurveOperator(bpy.types.Operator):
                 bcoords = poly_3d_calc(corners, loc)
                 new_point = [face_index , bcoords[1:]]
                 #Add control point
-                try: 
-                    utils.send_tan_extension(spline.comm.s, self.points_bar[-2], self.points_bar[-1])
-                    new_control = spline.comm.s.recv(2048).decode().splitlines()[0].split()
-                except:
-                    self.invalidate_target()
-                    return {'FINISHED'}
-                new_bar = [int(new_control[0]), [float(new_control[1]), float(new_control[2])]]
-                new_points_bar = [self.points_bar[-1].get(), new_bar, new_point, new_point]
-                
-                if not self.add_curve(context, new_points_bar): return {'FINISHED'} 
-                if not self.draw_tan(context): return {'FINISHED'}
+                if not self.extend(context, new_point): return self.finish(context) 
+                if not self.draw_tan(context): return self.finish(context)
                 self.push_state()
             return {'RUNNING_MODAL'}
-        #Drag
+        #Drag, only the latest position is kept and processed at most once per frame
+        #Engine answers are applied on the timer, the UI never waits for them
         elif event.type == 'MOUSEMOVE' and self.clicking:
-            if not self.drag:
-                self.drag = True
-            hit_obj, loc, normal, face_index = utils.ray_cast(context, event)
-            if not hit_obj: return {'RUNNING_MODAL'}
-            hit_obj = bpy.context.scene.objects[hit_obj.name]
-            if utils.key_name in hit_obj and hit_obj[utils.key_name] == self.target[utils.key_name]:
-                idx = context.scene.curr_idx
-                #Calculate barycentric coords
-                mesh = self.target.data
-                poly = mesh.polygons[face_index]
-                corners = [mesh.vertices[vid].co for vid in poly.vertices]
-                bcoords = poly_3d_calc(corners, loc)
-                new_point = [face_index , bcoords[1:]]
-                #Update point
-                utils.update_point(self.points_bar[idx], new_point)
-                            
-                #Closed curve cases
-                if self.curve_item.is_closed and idx == 0:
-                    utils.update_point(self.points_bar[idx-1], new_point)
-                    
-                if self.curve_item.is_closed and idx == len(self.points_bar) - 1:
-                    utils.update_point(self.points_bar[0], new_point)
-                     
-                #Draw
-                if not self.draw_curve(): return {'FINISHED'}
-                #Update tangents
-                if self.curve_item.smooth:
-                    idx = context.scene.curr_idx
-                    if idx % 3 == 1 and (idx > 1 or self.curve_item.is_closed):
-                        p1 = idx-2
-                        p2 = idx-1
-                        p3 = idx
-                        if idx == 1: p1 = len(self.points_bar) -2 
-                        new_point = rotate_tan(self.points_bar[p1].get(), self.points_bar[p2].get(), self.points_bar[p3].get(), 0)
-                        if not new_point:
-                            self.invalidate_target()
-                            return {'FINISHED'}
-                        utils.update_point(self.points_bar[p1], new_point)
-                        
-                    if idx%3==2 and (idx<len(self.points_bar)-2 or self.curve_item.is_closed):
-                        p1 = idx
-                        p2 = idx+1
-                        p3 = idx+2
-                        if idx == len(self.points_bar) -2: p3 = 1
-                        new_point = rotate_tan(self.points_bar[p1].get(), self.points_bar[p2].get(), self.points_bar[p3].get(), 1)
-                        if not new_point:
-                            self.invalidate_target()
-                            return {'FINISHED'}
-                        utils.update_point(self.points_bar[p3], new_point)
-                     
-                if not self.draw_tan(context): return {'FINISHED'}
+            self.drag = True
+            self.drag_coord = event.mouse_region_x, event.mouse_region_y
+            if self.drag_timer is None:
+                self.drag_timer = context.window_manager.event_timer_add(1/context.scene.drag_fps, window=context.window)
+            if not self.update_drag(context): return self.finish(context)
+            return {'RUNNING_MODAL'}
+        elif event.type == 'TIMER' and self.drag_timer is not None:
+            if not self.update_drag(context): return self.finish(context)
             return {'RUNNING_MODAL'}
         #Sharp/smooth tangents switch
         elif event.type== 'T' and event.value== 'RELEASE':
@@ -249,13 +567,7 @@ class EditCurveOperator(bpy.types.Operator):
         elif event.type== 'S' and event.value== 'RELEASE':
             self.split_mode = True
             self.report({'INFO'}, "Enter split mode")
-        
-            self.tan.data.splines.clear( )
-            poly = self.tan.data.splines.new('POLY')
-            bpy.context.view_layer.objects.active = self.tan
-            bpy.ops.object.mode_set(mode = 'EDIT') 
-            self.tan.data.splines[0].points[0].select = True 
-            if not self.draw_t0(): return {'FINISHED'}
+            if not self.start_split(): return self.finish(context)
             return {'RUNNING_MODAL'}
             
         #Close spline
@@ -263,33 +575,7 @@ class EditCurveOperator(bpy.types.Operator):
             #print("Closed test: ", self.curve_item.is_closed)
             #self.push_state()
             if not self.curve_item.is_closed: 
-                
-                #Close spline
-                start = self.points_bar[0].get()
-                end   = self.points_bar[-1].get()
-                #Check if already overlapping 
-                if start[0] != end[0] or start[1][0] != end[1][0] or start[1][1] != end[1][1]:  
-                    if self.curve_item.smooth:
-                        #Extension 1
-                        try:
-                            utils.send_tan_extension(spline.comm.s, self.points_bar[1], self.points_bar[0])
-                            new_control = spline.comm.s.recv(2048).decode().splitlines()[0].split()
-                        except:
-                            self.invalidate_target()
-                            return {'FINISHED'}
-                        new_bar_1 = [int(new_control[0]), [float(new_control[1]), float(new_control[2])]]
-                        #extension 2
-                        try:
-                            utils.send_tan_extension(spline.comm.s, self.points_bar[-2], self.points_bar[-1])
-                            new_control_2 = spline.comm.s.recv(2048).decode().splitlines()[0].split()
-                        except:
-                            self.invalidate_target()
-                            return {'FINISHED'}
-                        new_bar_2 = [int(new_control_2[0]), [float(new_control_2[1]), float(new_control_2[2])]]
-                        new_points_bar = [self.points_bar[-1].get(), new_bar_2, new_bar_1, self.points_bar[0].get()]
-                    else: new_points_bar = [self.points_bar[-1].get(), self.points_bar[-1].get(), self.points_bar[0].get(), self.points_bar[0].get()]
-                    if not self.add_curve(context, new_points_bar): return {'FINISHED'}
-                self.curve_item.is_closed = True
+                if not self.close_curve(context): return self.finish(context)
                 self.report({'INFO'}, "Spline closed")
             else: 
                 self.curve_item.is_closed = False
@@ -300,11 +586,26 @@ class EditCurveOperator(bpy.types.Operator):
         elif event.type == 'X' and event.value == 'RELEASE':
             #self.push_state()
             self.delete_segment(context)
-            if not self.draw_curve(): return {'FINISHED'} 
-            if not self.draw_tan(context):   return {'FINISHED'}
+            if not self.draw_curve(): return self.finish(context) 
+            if not self.draw_tan(context):   return self.finish(context)
             self.push_state()
         return {'RUNNING_MODAL'}
 
+    #Modal cancelled by Blender (file load, window closed)
+    def cancel(self, context):
+        self.finish(context)
+    
+    #Every exit of the modal: the session changes become a global undo step, the draw handler and the timers are removed
+    #Output: result of the modal
+    def finish(self, context, result = {'FINISHED'}):
+        global is_running
+        self.commit_history()
+        self.stop_drag_timer(context)
+        if self.timer is not None: self.stop_timer(context)
+        self.overlay.stop()
+        is_running = False
+        return result
+
     def invoke(self, context, event):
         global is_running
         context.scene.curr_idx = 0
@@ -319,10 +620,12 @@ class EditCurveOperator(bpy.types.Operator):
             if not self.init_refs(): return {'CANCELLED'}
             bpy.ops.object.mode_set(mode='OBJECT') 
             bpy.ops.object.select_all(action='DESELECT')
-            spline.set_server(self.target)
-            if not self.draw_curve(): return {'CANCELLED'}
-            if not self.draw_tan(context): return {'CANCELLED'} 
-            self.push_state()
+            self.ready = spline.set_server(self.target)
+            if self.ready.done():
+                if not self.start(context): return {'CANCELLED'}
+            else:
+                self.report({'INFO'}, "Loading server")
+                self.timer = context.window_manager.event_timer_add(0.05, window=context.window)
             is_running = True
             context.window_manager.modal_handler_add(self)
             return {'RUNNING_MODAL'}
@@ -330,87 +633,108 @@ class EditCurveOperator(bpy.types.Operator):
             self.report({'WARNING'}, "Active space must be a View3d")
             return {'CANCELLED'}
     
-    def init_refs(self):
-        #Set curve pointer
-        self.curve = utils.getObjByKey(self.curve_key)
-        #Set tan pointer, create if necessary
-        tan = utils.getObjByKey("t")
-        if tan is None:
-            tan = create_poly("tangent_tmp", (1,0,0,1), self.curve.data.bevel_depth)    
-        self.tan = tan
-        geo_key = self.curve[utils.key_name]
-        #Set target pointer
-        idx = geo_key.find('o')
-        curve_idx = int(geo_key[1:idx])
-        obj_key = geo_key[idx:]
-        target = utils.getObjByKey(obj_key)
-        if target is None:
-            self.report({'WARNING'}, "Curve invalidated since the geometry has been modified")
-            return False 
-        self.target = target
-        #Set curve info
-        self.curve_item = utils.obj_curves_get(obj_key).value[curve_idx]
-        self.points_bar = self.curve_item.points_bar
+    #Apply the answers of the drag position in flight, then send the latest pending position
+    #At most one position is in flight and one processed per frame, positions in between are dropped
+    #Input: wait for the answers (mouse release)
+    def update_drag(self, context, wait = False):
+        if self.drag_request is not None:
+            if not wait and not self.drag_request.done(): return True
+            request = self.drag_request
+            self.drag_request = None
+            if not self.apply_drag(context, request): return False
+        if self.drag_coord is None: 
+            #Mouse held still, final density until the next move
+            if not wait and time.perf_counter() - self.drag_time > LOD_IDLE_TIME: return self.set_lod(context, False)
+            return True
+        if not wait and time.perf_counter() - self.drag_time < 1/context.scene.drag_fps: return True
+        coord = self.drag_coord
+        self.drag_coord = None
+        self.drag_time = time.perf_counter()
+        try: 
+            #Coarse curve while dragging
+            subdivisions = self.lod(context, True)
+            if subdivisions != self.subdivisions:
+                spline.send_params(subdivisions)
+                self.subdivisions = subdivisions
+            self.drag_request = self.drag_to(context, coord)
+        except:
+            self.invalidate_target()
+            return False
+        if wait: return self.update_drag(context, wait)
         return True
     
-    def push_state(self):
-        bpy.context.view_layer.objects.active = None
-        bpy.ops.ed.undo_push()
-        bpy.context.view_layer.objects.active = self.tan
+    #Subdivision level of the curve, coarser while interacting if interaction_subdivisions is lower
+    def lod(self, context, interactive):
+        if interactive: return min(context.scene.interaction_subdivisions, context.scene.subdivisions)
+        return context.scene.subdivisions
     
-    def eval_point(self):
-        n_splines = (len(self.points_bar) - 1)/3
-        anchor = int(self.t0) * 3
-        t0_loc = self.t0 - int(self.t0)
-        if anchor == n_splines*3: 
-            anchor -= 3
-            t0_loc = 1
-        #print("Anchor: ", anchor, " t0: ", t0_loc)
-        
-        send = "p\n"+str(t0_loc)+"\n"
-        for i in range(4): send += utils.pbar2str( self.points_bar[anchor + i].get() ) 
-        spline.comm.s.sendall(send.encode())
-        new_control = spline.comm.s.recv(2048).decode().splitlines()[0].split()
-        return [int(new_control[0]), float(new_control[1]), float(new_control[2])]
+    #Switch the engine to the level of detail and redraw the curve if it changed
+    def set_lod(self, context, interactive):
+        subdivisions = self.lod(context, interactive)
+        if subdivisions == self.subdivisions: return True
+        try: spline.send_params(subdivisions)
+        except:
+            self.invalidate_target()
+            return False
+        self.subdivisions = subdivisions
+        return self.draw_curve()
     
-    def draw_t0(self):
-        #Set coord
-        p_bar = []
+    def stop_drag_timer(self, context):
+        if self.drag_timer is None: return
+        context.window_manager.event_timer_remove(self.drag_timer)
+        self.drag_timer = None
+    
+    #Move the selected control point under coord
+    #Output: requests in flight, None if the target is not hit
+    @profiling.timed("edit drag_to")
+    def drag_to(self, context, coord):
+        hit_obj, loc, normal, face_index = utils.ray_cast(context, None, coord, self.target)
+        if not hit_obj: return None
+        hit_obj = bpy.context.scene.objects[hit_obj.name]
+        if utils.key_name in hit_obj and hit_obj[utils.key_name] == self.target[utils.key_name]:
+            #Calculate barycentric coords
+            mesh = self.target.data
+            poly = mesh.polygons[face_index]
+            corners = [mesh.vertices[vid].co for vid in poly.vertices]
+            bcoords = poly_3d_calc(corners, loc)
+            return self.move_point(context, [face_index , bcoords[1:]])
+        return None
+    
+    def stop_timer(self, context):
+        context.window_manager.event_timer_remove(self.timer)
+        self.timer = None
+    
+    #Draw curve and tangents once the engine is ready
+    def start(self, context):
         try: 
-            p_bar.append( self.eval_point() ) 
-            utils.convert_coords(self.target, p_bar)
+            self.ready.result()
+            spline.send_params()
         except:
-            self.invalidate_target()
+            self.report({'WARNING'}, "Engine failed to start")
             return False
-        
-        x, y, z = p_bar[0]
-        self.tan.data.splines[0].points[0].co = (x, y, z, 1.0) 
+        self.segment_cache = {}
+        self.subdivisions = context.scene.subdivisions
+        if not self.draw_curve(): return False
+        if not self.draw_tan(context): return False
+        self.history = UndoHistory(self.points_bar, self.curve_item, context.scene.curr_idx)
+        self.overlay.start()
         return True
     
-    def draw_pickable(self, context):
-        pickable = range(0, len(self.points_bar), 3) 
-        #Closed curve case
-        if self.curve_item.is_closed and (context.scene.curr_idx == 0 or context.scene.curr_idx == len(self.points_bar)-1): 
-            pickable = range(3, len(self.points_bar)-1, 3)
-        for i in pickable:
-            if i !=  context.scene.curr_idx: 
-                #Overlapping check
-                if i > context.scene.curr_idx:
-                    p1 = self.points_bar[context.scene.curr_idx].get()
-                    p2 = self.points_bar[i].get()
-                    if p1[0] == p2[0] and p1[1][0] == p2[1][0] and p1[1][1] == p2[1][1]: continue  
-                #Calculate 3d point
-                p_bar = self.points_bar[i].get()
-                p = [[p_bar[0], p_bar[1][0], p_bar[1][1]]]
-                utils.convert_coords(self.target, p)
-                #Add to object
-                poly = self.tan.data.splines.new('POLY')
-                poly.points.add( 1 )
-                x,y,z = p[0]
-                poly.points[0].co = (x, y, z, 1)
-                poly.points[1].co = (x, y, z, 1)        
-        
-        
+    def push_state(self):
+        self.history.push(self.points_bar, self.curve_item, bpy.context.scene.curr_idx)
+    
+    #One global undo step for the whole session, pushed once
+    #Changes not recorded yet (exit on an engine error) are part of it
+    def commit_history(self):
+        history, self.history = self.history, None
+        if history is None: return
+        #Curve data freed when cancelled by a file load
+        try: history.push(self.points_bar, self.curve_item, bpy.context.scene.curr_idx)
+        except: return
+        if not history.changed(): return
+        bpy.ops.ed.undo_push(message="Edit bezier spline")
+    
+    @profiling.timed("edit pick")
     def pick(self, context, point_2d):
         obj = self.target
         points_bar = self.points_bar
@@ -427,192 +751,26 @@ class EditCurveOperator(bpy.types.Operator):
         if self.curve_item.is_closed and anchor_idx == 0: tan_points.append(len(self.points_bar)-2)
         if self.curve_item.is_closed and anchor_idx == len(self.points_bar)-1: tan_points.append(1)
         
-        best_idx = -1
-        best_dist = -1
-        for idx, p_item in enumerate( points_bar ):
-            if idx % 3 == 0 or idx in tan_points:
-                #Convert barycentric coord in 3D
-                curr_p = [[p_item.get()[0], p_item.get()[1][0], p_item.get()[1][1]]]
-                try: utils.convert_coords(obj, curr_p)
-                except:
-                    self.invalidate_target()
-                    return False
-                #Project on screen
-                co_2d = view3d_utils.location_3d_to_region_2d(region, region_3d, curr_p[0])
-                dist = np.sqrt((point_2d[0]-co_2d[0])**2 + (point_2d[1]-co_2d[1])**2)
-                #Occlusion check
-                face_idx = p_item.get()[0]
-                hit_obj, _, _, hit_face = utils.ray_cast(context, None, co_2d)
-                if hit_obj and utils.key_name in hit_obj:
-                    if hit_obj[utils.key_name] == obj[utils.key_name] and hit_face == face_idx:
-                        #Not occluded, can be selected
-                        if best_idx == -1 or dist <= best_dist:
-                            best_idx = idx
-                            best_dist = dist
-        if best_idx != context.scene.curr_idx: 
-            if best_dist < 60: context.scene.curr_idx =  best_idx
-            else: context.scene.curr_idx = 0
-        
-        return True
-    
-    def split(self, context):
-        #Send request
-        old_len = len(self.points_bar)
-        anchor = int(self.t0) * 3
-        t0_loc = self.t0 - int(self.t0)
-        if anchor == len(self.points_bar) - 1: 
-            anchor -= 3
-            t0_loc = 1 
-        points_bar = []
-        for i in range(4): points_bar.append( self.points_bar[anchor + i].get() )
-        try: utils.send_split(spline.comm.s, points_bar, t0_loc)
+        pickable = [idx for idx in range(len(points_bar)) if idx % 3 == 0 or idx in tan_points]
+        try: self.pick_index.update(obj, points_bar, region, region_3d)
         except:
             self.invalidate_target()
             return False
-        new_points, _ = utils.recv_points(spline.comm.s)
-        to_push = [p.get() for p in self.points_bar[-3:]]
-        #Add new points
-        for p in to_push: utils.add_point(self.points_bar, p) 
-        #Move points
-        if old_len - anchor > 7:
-            from_idx = len(self.points_bar) - 4
-            to_idx = anchor + 6
-            for i in range(from_idx, anchor + 6, -1): 
-                utils.update_point(self.points_bar[i], self.points_bar[i-3].get())
+        #Occlusion check only for the points near the click, nearest first: by the target mesh, then by the scene
+        best_idx = 0
+        for idx in self.pick_index.nearest(point_2d, pickable, 60):
+            co_2d = self.pick_index.screen[idx]
+            face_idx = points_bar.faces[idx]
+            hit_obj, _, _, hit_face = utils.ray_cast(context, None, co_2d, self.target)
+            if hit_obj and utils.key_name in hit_obj:
+                if hit_obj[utils.key_name] == obj[utils.key_name] and hit_face == face_idx:
+                    #Hidden by another object in front of the target
+                    if utils.occluded(context, co_2d, self.pick_index.coords[idx], obj): continue
+                    #Not occluded, can be selected
+                    best_idx = int(idx)
+                    break
+        if best_idx != context.scene.curr_idx: context.scene.curr_idx = best_idx
         
-        #Copy new points
-        for i in range( len(new_points) ):
-            p_bar = [new_points[i][0], [new_points[i][1], new_points[i][2]]]
-            utils.update_point(self.points_bar[anchor + i], p_bar)
-            
-        context.scene.curr_idx = anchor + 3
-        return True
-    
-    def draw_curve(self):
-        poly = self.curve.data.splines.new('POLY')
-        for i in range(0, len(self.points_bar) - 1, 3):
-            segment = []
-            for j in range(4): segment.append(self.points_bar[i+j].get())
-            try: curve_seg = utils.get_curve(spline.comm.s, self.target, segment)
-            except:
-                self.invalidate_target()
-                return False
-
-            old_len = len( poly.points )
-            poly.points.add( len(curve_seg)-1 ) 
-            #If first segment add first point
-            if i == 0: 
-                x,y,z = curve_seg[0]
-                poly.points[0].co = (x, y, z, 1) 
-            for i, coord in enumerate(curve_seg[1:]):
-                x,y,z = coord
-                poly.points[i + old_len].co = (x, y, z, 1)
-        self.curve.data.splines.remove( self.curve.data.splines[0] )
-        return True
-    
-    def draw_tan(self, context):
-        self.tan.data.splines.clear()
-        
-        tan_1 = []
-        tan_2 = []
-        
-        idx = context.scene.curr_idx #Closest anchor point
-        if idx % 3 == 1: idx -= 1
-        if idx % 3 == 2: idx += 1
-        
-        poly = None
-        if idx > 0 or self.curve_item.is_closed:
-            p1 = idx-1
-            p2 = idx
-            if idx == 0: p1 = len(self.points_bar) -2
-            try: tan_1 = utils.get_straight_path(spline.comm.s, self.target, self.points_bar[p1].get(), self.points_bar[p2].get())
-            except:
-                self.invalidate_target()
-                return False 
-            utils.convert_coords(self.target, tan_1)
-            poly = self.tan.data.splines.new('POLY')
-            poly.points.add(len(tan_1)-1)
-            for i, coord in enumerate(tan_1):
-                x,y,z = coord
-                poly.points[i].co = (x, y, z, 1)
-                poly.points[i].hide = True
-            poly.points[0].hide = False
-            poly.points[-1].hide = False
-        if idx < len(self.points_bar) - 2 or self.curve_item.is_closed:
-            p1 = idx
-            p2 = idx+1
-            if idx == len(self.points_bar) -1: p2 = 1
-            try: tan_2 = utils.get_straight_path(spline.comm.s, self.target, self.points_bar[p1].get(), self.points_bar[p2].get())
-            except:
-                self.invalidate_target()
-                return False
-            utils.convert_coords(self.target, tan_2)
-            old_len = 0
-            from_idx = 1
-            if poly is None: 
-                poly = self.tan.data.splines.new('POLY')
-                from_idx = 0
-            else: old_len = len(poly.points) 
-            poly.points.add(len(tan_2)-1)
-            for i, coord in enumerate(tan_2[from_idx:]):
-                x,y,z = coord
-                poly.points[old_len + i].co = (x, y, z, 1)
-                poly.points[old_len + i].hide = True
-            if len(tan_1) == 0: poly.points[0].hide = False
-            poly.points[-1].hide = False
-        #Select vert   
-        bpy.context.view_layer.objects.active = self.tan
-        bpy.ops.object.mode_set(mode = 'EDIT')          
-        if context.scene.curr_idx % 3 == 2: to_select = 0
-        if context.scene.curr_idx % 3 == 1: to_select = len(poly.points) - 1
-        if context.scene.curr_idx % 3 == 0:
-            if   len(tan_1) == 0: to_select = 0
-            else: to_select = len(tan_1) - 1   
-        self.tan.data.splines[0].points[to_select].select = True  
-        #Draw other pickable objects first
-        try: self.draw_pickable(context)
-        except:
-            self.invalidate_target()
-            return False
-        
-        return True
-    
-    def delete_segment(self, context):
-        if len(self.points_bar) == 4: 
-            self.report({'WARNING'}, "Only one segment present") 
-            return
-        idx = context.scene.curr_idx #Closest anchor point
-        if idx % 3 == 1: idx -= 1
-        if idx % 3 == 2: idx += 1
-        
-        if idx == 0: idx = 1
-        if idx == len(self.points_bar) - 1: 
-            idx -= 1
-            context.scene.curr_idx -= 3
-        
-        self.points_bar.remove(idx + 1)
-        self.points_bar.remove(idx)
-        self.points_bar.remove(idx -1)
-        
-        if context.scene.curr_idx > len(self.points_bar) - 1:
-            context.scene.curr_idx = len(self.points_bar) - 1
-        
-    def add_curve(self, context, new_points_bar):
-        utils.add_point(self.points_bar, new_points_bar[1])
-        utils.add_point(self.points_bar, new_points_bar[2])
-        utils.add_point(self.points_bar, new_points_bar[3])
-        #Calculate additional curve and draw
-        try: curve = utils.get_curve(spline.comm.s, self.target, new_points_bar)
-        except:
-            self.invalidate_target()
-            return False
-        poly_line = self.curve.data.splines[0]
-        old_len_curve = len( poly_line.points )
-        poly_line.points.add( len(curve)-1 )
-        for i, coord in enumerate(curve[1:]):
-            x,y,z = coord
-            poly_line.points[i + old_len_curve].co = (x, y, z, 1)
-        context.scene.curr_idx = len(self.points_bar) - 1
         return True
     
     def invalidate_target(self):
@@ -621,7 +779,7 @@ class EditCurveOperator(bpy.types.Operator):
         
         del self.target[utils.key_name]
         utils.reset_spline_server(spline.comm)
-        bpy.data.objects.remove(self.tan, do_unlink=True)
+        self.overlay.stop()
         self.report({'WARNING'}, "Geometry modified, curves on the objects invalidated")        
     
 def menu_func(self, context):
@@ -0,0 +1,103 @@
+import bpy
+import gpu
+import numpy as np
+
+#----------EDITING OVERLAY------------------------------------------------------
+#Tangent handles, pickable anchors and the split point of the edited curve drawn in the 3D viewport
+#with the gpu module, no scene object is created or evaluated while editing
+#Batches are built on the first draw after the drawn points change, points can be set without a GPU context
+
+HANDLE_COLOR   = (1.0, 0.0, 0.0, 1.0)
+SELECTED_COLOR = (1.0, 0.6, 0.0, 1.0)
+SPLIT_COLOR    = (1.0, 1.0, 1.0, 1.0)
+POINT_SIZE = 8
+LINE_WIDTH = 2
+
+def uniform_color_shader():
+    try: return gpu.shader.from_builtin('UNIFORM_COLOR')
+    except: return gpu.shader.from_builtin('3D_UNIFORM_COLOR') #Before Blender 4.0
+
+#Vertex buffer of 3d points drawn as one primitive
+class Batch:
+    def __init__(self, prim_type):
+        self.prim_type = prim_type
+        self.coords = np.empty((0, 3), dtype=np.float32)
+        self.batch = None
+
+    def update(self, coords):
+        coords = np.asarray(coords, dtype=np.float32).reshape(-1, 3)
+        if np.array_equal(coords, self.coords): return
+        self.coords = coords
+        self.batch = None
+
+    def draw(self, shader, color):
+        if len(self.coords) == 0: return
+        if self.batch is None:
+            fmt = gpu.types.GPUVertFormat()
+            fmt.attr_add(id="pos", comp_type='F32', len=3, fetch_mode='FLOAT')
+            vbo = gpu.types.GPUVertBuf(fmt, len(self.coords))
+            vbo.attr_fill("pos", self.coords)
+            self.batch = gpu.types.GPUBatch(type=self.prim_type, buf=vbo)
+        shader.uniform_float("color", color)
+        self.batch.draw(shader)
+
+class Overlay:
+    def __init__(self):
+        self.handle = None #Draw handler of the 3D viewports
+        self.shader = None
+        self.handles  = Batch('LINE_STRIP') #Tangent paths through the anchor
+        self.markers  = Batch('POINTS') #Anchor and tangent ends
+        self.anchors  = Batch('POINTS') #Other pickable anchors
+        self.selected = Batch('POINTS')
+        self.split    = Batch('POINTS')
+
+    def start(self):
+        if self.handle is not None: return
+        self.shader = uniform_color_shader()
+        self.handle = bpy.types.SpaceView3D.draw_handler_add(self.draw, (), 'WINDOW', 'POST_VIEW')
+
+    def stop(self):
+        if self.handle is None: return
+        bpy.types.SpaceView3D.draw_handler_remove(self.handle, 'WINDOW')
+        self.handle = None
+        self.tag_redraw()
+
+    #Input: (N,3) tangent paths, indices of the marked points and of the selected point
+    def set_handles(self, coords, markers, selected):
+        coords = np.asarray(coords, dtype=np.float32).reshape(-1, 3)
+        self.handles.update(coords)
+        self.markers.update(coords[markers])
+        self.selected.update(coords[[selected]])
+        self.split.update([])
+        self.tag_redraw()
+
+    def set_anchors(self, coords):
+        self.anchors.update(coords)
+        self.tag_redraw()
+
+    #Split preview, the handles are hidden
+    def set_split_point(self, coord):
+        for batch in (self.handles, self.markers, self.anchors, self.selected): batch.update([])
+        self.split.update([coord])
+        self.tag_redraw()
+
+    def tag_redraw(self):
+        for window in bpy.context.window_manager.windows:
+            for area in window.screen.areas:
+                if area.type == 'VIEW_3D': area.tag_redraw()
+
+    def draw(self):
+        gpu.state.depth_test_set('LESS_EQUAL')
+        gpu.state.line_width_set(LINE_WIDTH)
+        gpu.state.point_size_set(POINT_SIZE)
+        self.shader.bind()
+        self.handles.draw(self.shader, HANDLE_COLOR)
+        self.markers.draw(self.shader, HANDLE_COLOR)
+        self.anchors.draw(self.shader, HANDLE_COLOR)
+        self.split.draw(self.shader, SPLIT_COLOR)
+        #Selected point over the others
+        gpu.state.depth_test_set('ALWAYS')
+        self.selected.draw(self.shader, SELECTED_COLOR)
+        gpu.state.depth_test_set('NONE')
+        gpu.state.line_width_set(1)
+        gpu.state.point_size_set(1)
@@ -0,0 +1,106 @@
+import bpy
+import time
+import json
+import threading
+import functools
+import numpy as np
+from collections import deque
+from bpy_extras.io_utils import ExportHelper
+
+#----------LATENCY PROFILER-----------------------------------------------------
+#Opt-in timing of the editing stages, enabled with the profiling scene option
+#Each operation keeps its last WINDOW samples for the rolling percentiles
+
+WINDOW = 512 #Samples kept per operation
+PERCENTILES = (50, 95, 99)
+
+enabled = False
+samples = {} #operation name -> deque of durations in seconds
+lock = threading.Lock()
+
+def set_enabled(value):
+    global enabled
+    enabled = value
+
+def record(name, seconds):
+    if not enabled: return
+    with lock:
+        window = samples.get(name)
+        if window is None: window = samples[name] = deque(maxlen=WINDOW)
+        window.append(seconds)
+
+def reset():
+    with lock: samples.clear()
+
+#Time a block of code
+#Usage: with profiling.stage("pick"): ...
+class stage:
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, time.perf_counter() - self.start)
+        return False
+
+#Time every call of the decorated function
+def timed(name):
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not enabled: return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try: return fn(*args, **kwargs)
+            finally: record(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+#Output: operation name -> count, mean and percentiles in milliseconds, sorted by name
+def summary():
+    with lock: windows = {name: np.array(window) for name, window in samples.items()}
+    result = {}
+    for name in sorted(windows):
+        ms = windows[name] * 1000
+        if len(ms) == 0: continue
+        stats = {"count": len(ms), "mean": float(ms.mean())}
+        for p, value in zip(PERCENTILES, np.percentile(ms, PERCENTILES)):
+            stats["p" + str(p)] = float(value)
+        result[name] = stats
+    return result
+
+def export_json(filepath):
+    data = {"window": WINDOW, "unit": "ms", "operations": summary()}
+    with open(filepath, 'w') as f:
+        json.dump(data, f, indent=2)
+
+#----------OPERATORS-------------------------------------------------------------
+class ExportProfileOperator(bpy.types.Operator, ExportHelper):
+    """Export the latency percentiles to JSON"""
+    bl_idname = "geodesic.export_profile"
+    bl_label = "Export profile"
+    filename_ext = ".json"
+
+    def execute(self, context):
+        export_json(self.filepath)
+        self.report({'INFO'}, "Profile exported")
+        return {'FINISHED'}
+
+class ResetProfileOperator(bpy.types.Operator):
+    """Clear the latency samples"""
+    bl_idname = "geodesic.reset_profile"
+    bl_label = "Reset profile"
+
+    def execute(self, context):
+        reset()
+        return {'FINISHED'}
+
+def register():
+    bpy.utils.register_class(ExportProfileOperator)
+    bpy.utils.register_class(ResetProfileOperator)
+
+def unregister():
+    bpy.utils.unregister_class(ExportProfileOperator)
+    bpy.utils.unregister_class(ResetProfileOperator)
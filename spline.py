@@ -1,5 +1,6 @@
 import sys
 import os
+import time
 import bpy
 import bmesh
 import numpy as np
@@ -7,35 +8,64 @@ from bpy_extras import view3d_utils
 from mathutils import Vector
 from mathutils.interpolate import poly_3d_calc
 
-dir = os.path.dirname(bpy.context.space_data.text.filepath) #Get directory of the .py file
+if bpy.context.space_data is not None: dir = os.path.dirname(bpy.context.space_data.text.filepath) #Get directory of the .py file
+else: dir = os.path.dirname(os.path.abspath(__file__)) #Imported by a script (benchmarks)
 sys.path.append(dir) #Setting it as the python directory in the Blender Text editor 
 
 import utils
+import profiling
 
 class GeodesicCurveInfo:
     def __init__(self):        
         self.points_bar  = [] #Control points in barycentric coordinates
         self.points_idx  = [] #Indices of control points in the mesh (subgroup of polygon_idx)
         
-comm = utils.ServerCommunication()
+comm = utils.ServerCommunication() #Engine of the current working mesh
+pool = utils.EnginePool() #Engines kept running for recently used meshes
 
 
 #----------MOVE CONTROL POINT OPERATOR COMMUNICATION FUNCTIONS------------
 
-#Control if requested object is the current working mesh, otherwise close it and create new process
+#Switch to the engine of the requested object, launch a new process if none is running
+#Output: future resolved once the engine accepts requests, call send_params then
 def set_server(obj):
-    if obj[utils.key_name] != comm.obj_key:
-        #Close communication if other communication was active
-        if comm.obj_key is not None:
-            utils.close_spline_server(comm)
-        utils.save_file(obj.data, dir + "/bezier/data/tmp.obj")
-        utils.run_spline_server(dir, comm)
-        comm.obj_key = obj[utils.key_name]
-    #Set params
-    if bpy.context.scene.decastel_jau: send = "od\n"
-    else: send = "os\n"
-    send += str( bpy.context.scene.subdivisions ) + "\n"
-    comm.s.sendall(send.encode())
+    global comm
+    key = obj[utils.key_name]
+    #Running engines speak the protocol they were launched with
+    if bpy.context.scene.binary_protocol != utils.wire_binary: pool.close_all()
+    running = pool.get(key)
+    if running is not None:
+        #The engine, the snapshot and the BVH tree are stale if the geometry changed since the launch
+        utils.drop_mesh_snapshot(obj.data)
+        if running.digest != utils.mesh_digest(obj.data):
+            pool.remove(key)
+            running = None
+    if running is None:
+        comm = utils.ServerCommunication()
+        utils.clear_mesh_snapshots()
+        digest = utils.mesh_digest(obj.data)
+        comm.digest = digest
+        if bpy.context.scene.shared_memory_mesh:
+            shm = utils.share_mesh(obj.data)
+            try: ready = utils.start_spline_server(dir, comm, "shm:" + shm.name, digest)
+            except:
+                utils.release_mesh(shm)
+                raise
+            #The engine has loaded the mesh once it is ready
+            ready.add_done_callback(lambda f: utils.release_mesh(shm))
+        else:
+            mesh = utils.export_mesh(obj.data, dir + "/bezier/data")
+            utils.start_spline_server(dir, comm, mesh, digest)
+        comm.obj_key = key
+        pool.add(comm, bpy.context.scene.engine_pool_size)
+    else: comm = running
+    return comm.ready
+
+#Set params of the current engine, subdivisions of the scene if not given
+def send_params(subdivisions = None):
+    scene = bpy.context.scene
+    if subdivisions is None: subdivisions = scene.subdivisions
+    utils.send_params(comm.s, scene.algorithm, subdivisions, scene.precision, scene.parallel)
 
 #----------SPLINE DRAWING FUNCTION-----------------------
 
@@ -47,19 +77,33 @@ def draw_curve(obj, curve):
     curve_data.dimensions = '3D'  
 
     obj_curve = bpy.data.objects.new(curve_name, curve_data)
-    obj_curve[utils.key_name] = curve_name
     bpy.context.view_layer.active_layer_collection.collection.objects.link(obj_curve)
+    utils.set_key(obj_curve, curve_name)
 
     curve_line = curve_data.splines.new('POLY')
-    curve_line.points.add(len(curve)-1)
-    for i, coord in enumerate(curve):
-        x,y,z = coord
-        curve_line.points[i].co = (x, y, z, 1)
+    utils.set_poly_points(curve_line, curve)
     
     material = bpy.data.materials.new(curve_name+"polygon_material")
     material.diffuse_color = (0.2,0.2,1,1)
     curve_data.materials.append(material)
     curve_data.bevel_depth = 0.01
+    return obj_curve
+
+#Evaluate the first segment of a new spline on obj, draw it and store its control points
+#Output: curve object
+def add_spline(obj, points_bar):
+    curve = utils.get_curve(comm.s, obj, points_bar)
+    obj_curve = draw_curve(obj, curve)
+    #Push curve info
+    utils.add_curve(obj[utils.key_name], points_bar)
+    return obj_curve
+
+#Give obj a geo key and an entry for its curves, the mesh is triangulated
+def add_target(obj):
+    utils.set_key(obj, "o" + str(bpy.context.scene.total))
+    bpy.types.Scene.total += 1
+    utils.push_key(obj[utils.key_name])
+    utils.triangulate_object(obj)
   
 class GeodesicCurve(bpy.types.Operator):
     #Geodesic curve
@@ -70,8 +114,19 @@ class GeodesicCurve(bpy.types.Operator):
     def __init__(self):
         self.points_bar = []
         self.obj_name = None
+        self.ready = None #Engine startup, launched on the first click
+        self.timer = None #Polls the engine startup after the last click
+        self.click_time = None
         
     def modal(self, context, event):
+        #Engine still loading after the last click, keep the viewport responsive
+        if self.timer is not None:
+            if event.type == 'ESC':
+                self.stop_timer(context)
+                return {'CANCELLED'}
+            if event.type != 'TIMER' or not self.ready.done(): return {'PASS_THROUGH'}
+            self.stop_timer(context)
+            return self.draw(context)
         if event.type in {'MIDDLEMOUSE', 'WHEELUPMOUSE', 'WHEELDOWNMOUSE'}:
             # allow navigation
             return {'PASS_THROUGH'}
@@ -84,13 +139,13 @@ class GeodesicCurve(bpy.types.Operator):
                     if self.obj_name is None:
                         #If first click save object and triangulate
                         self.obj_name = obj.name
+                        self.click_time = time.perf_counter()
                         if key_name not in obj:
-                            obj[key_name] = "o" + str(bpy.context.scene.total)
-                            bpy.types.Scene.total += 1
-                            utils.push_key(obj[key_name])
                             #Triangulate and recall the ray casting
-                            utils.triangulate_object(obj)
+                            add_target(obj)
                             hit_obj, loc, normal, face_index = utils.ray_cast(context, event)     
+                        #Create communication if necessary, the engine loads while the other points are picked
+                        self.ready = set_server(obj)
                              
                     if len(self.points_bar) < 3:
                         #Save point in barycentric coordinates
@@ -103,21 +158,9 @@ class GeodesicCurve(bpy.types.Operator):
                     #Enough points, draw
                     if len(self.points_bar) == 3:
                         self.points_bar.append( self.points_bar[-1] )    
-                        #Create communication if necessary
+                        if self.ready.done(): return self.draw(context)
                         self.report({'INFO'}, "Loading server")
-                        set_server(obj)
-                        self.report({'INFO'}, "Server loaded")
-                        #Calculate curve and draw
-                        try: curve = utils.get_curve(comm.s, obj, self.points_bar)
-                        except:
-                            del obj[utils.key_name]
-                            utils.reset_spline_server(comm)
-                            self.report({'WARNING'}, "Geometry modified, curves on the objects invalidated") 
-                            return {'CANCELLED'}
-                        draw_curve(obj, curve)
-                        #Push curve info
-                        utils.add_curve(obj[key_name], self.points_bar)
-                        return {'FINISHED'}
+                        self.timer = context.window_manager.event_timer_add(0.05, window=context.window)
 
                 return {'RUNNING_MODAL'}
         elif event.type in {'RIGHTMOUSE', 'ESC'}:
@@ -125,6 +168,30 @@ class GeodesicCurve(bpy.types.Operator):
 
         return {'RUNNING_MODAL'}
 
+    def stop_timer(self, context):
+        context.window_manager.event_timer_remove(self.timer)
+        self.timer = None
+
+    #Calculate curve and draw, once the engine is ready
+    @profiling.timed("geocurve draw")
+    def draw(self, context):
+        obj = bpy.context.scene.objects[self.obj_name]
+        try: 
+            self.ready.result()
+            send_params()
+        except:
+            self.report({'WARNING'}, "Engine failed to start")
+            return {'CANCELLED'}
+        try: add_spline(obj, self.points_bar)
+        except:
+            del obj[utils.key_name]
+            utils.reset_spline_server(comm)
+            self.report({'WARNING'}, "Geometry modified, curves on the objects invalidated") 
+            return {'CANCELLED'}
+        print("Click to first curve: %.3fs" % (time.perf_counter() - self.click_time))
+        profiling.record("geocurve first curve", time.perf_counter() - self.click_time)
+        return {'FINISHED'}
+
     def invoke(self, context, event):
         if context.space_data.type == 'VIEW_3D':
             if bpy.context.view_layer.objects.active: 
@@ -152,8 +219,9 @@ class PrintOperator(bpy.types.Operator):
             print(item.key, " ", len( item.value ), " curves" )
             for curve_idx, info in enumerate(item.value):
                 print("\tcurve_idx: ", curve_idx)
-                for p in info.points_bar:
-                    print("\t\t", p.get())
+                points_bar = utils.ControlPoints(info)
+                for i in range(len(points_bar)):
+                    print("\t\t", points_bar.get(i))
         print("_________________\n\n")
         return {'FINISHED'}
 
@@ -9,6 +9,7 @@ sys.path.append(dir) #Setting it as the python directory in the Blender Text edi
 import spline
 import edit
 import utils
+import profiling
 
 class MainPanel:
     bl_space_type = "VIEW_3D"
@@ -42,11 +43,71 @@ class PropertiesPanel(MainPanel, bpy.types.Panel):
     def draw(self, context):
         layout = self.layout
         row = layout.row()
-        row.prop(context.scene, 'decastel_jau')
+        row.prop(context.scene, 'algorithm')
+        
+        row = layout.row()
+        row.prop(context.scene, 'precision')
+        
+        row = layout.row()
+        row.prop(context.scene, 'parallel')
         
         row = layout.row()
         row.prop(context.scene, 'subdivisions')
+        
+        row = layout.row()
+        row.prop(context.scene, 'interaction_subdivisions')
+        
+        row = layout.row()
+        row.prop(context.scene, 'binary_protocol')
+        
+        row = layout.row()
+        row.prop(context.scene, 'engine_pool_size')
+        
+        row = layout.row()
+        row.prop(context.scene, 'shared_memory_mesh')
+        
+        row = layout.row()
+        row.prop(context.scene, 'engine_cache_size')
+        
+        row = layout.row()
+        row.prop(context.scene, 'drag_fps')
+        
+        row = layout.row()
+        row.prop(context.scene, 'split_step')
+        
+        row = layout.row()
+        row.prop(context.scene, 'split_arc_length')
+
+class ProfilingPanel(MainPanel, bpy.types.Panel):
+    bl_parent_id = "OBJECT_PT_geodesic"
+    bl_label = "Profiling"
+    bl_idname = "PROFILE_PT_geodesic"
+    bl_options = {"DEFAULT_CLOSED"}
+
+    def draw(self, context):
+        layout = self.layout
+        row = layout.row()
+        row.prop(context.scene, 'profiling')
+        row = layout.row()
+        row.prop(context.scene, 'engine_trace')
+        
+        #Rolling percentiles in milliseconds
+        stats = profiling.summary()
+        if stats:
+            col = layout.column(align=True)
+            row = col.row()
+            for text in ("operation", "n", "p50", "p95", "p99"): row.label(text=text)
+            for name, op in stats.items():
+                row = col.row()
+                row.label(text=name)
+                row.label(text=str(op["count"]))
+                for p in ("p50", "p95", "p99"): row.label(text="%.1f" % op[p])
+        
+        row = layout.row()
+        row.operator("geodesic.export_profile")
+        row.operator("geodesic.reset_profile")
 
+#Tangent object of files saved while editing with older versions, handles are now drawn as an overlay
 @persistent
 def remove_tan(scene):    
     tan = utils.getObjByKey("t")
@@ -57,16 +118,34 @@ def remove_tan(scene):
 def register():
     bpy.utils.register_class(GeodesicPanel)
     bpy.utils.register_class(PropertiesPanel)
+    bpy.utils.register_class(ProfilingPanel)
+    profiling.register()
     spline.register()
     edit.register()
     
+    #Key indices invalidated before the other handlers look up keys
+    bpy.app.handlers.undo_post.append(utils.key_index_reload)
+    bpy.app.handlers.redo_post.append(utils.key_index_reload)
+    bpy.app.handlers.load_post.append(utils.key_index_reload)
+    bpy.app.handlers.depsgraph_update_post.append(utils.key_index_update)
+    bpy.app.handlers.undo_post.append(utils.mesh_snapshot_reload)
+    bpy.app.handlers.redo_post.append(utils.mesh_snapshot_reload)
+    bpy.app.handlers.load_post.append(utils.mesh_snapshot_reload)
+    bpy.app.handlers.depsgraph_update_post.append(utils.mesh_snapshot_update)
     bpy.app.handlers.undo_post.append(remove_tan)
     bpy.app.handlers.redo_post.append(remove_tan)
 def unregister():
     bpy.utils.unregister_class(GeodesicPanel)
     bpy.utils.unregister_class(PropertiesPanel)
+    bpy.utils.unregister_class(ProfilingPanel)
+    profiling.unregister()
     spline.unregister()
     edit.unregister()
+    for handlers in (bpy.app.handlers.undo_post, bpy.app.handlers.redo_post, bpy.app.handlers.load_post):
+        if utils.key_index_reload in handlers: handlers.remove(utils.key_index_reload)
+        if utils.mesh_snapshot_reload in handlers: handlers.remove(utils.mesh_snapshot_reload)
+    for handler in (utils.key_index_update, utils.mesh_snapshot_update):
+        if handler in bpy.app.handlers.depsgraph_update_post: bpy.app.handlers.depsgraph_update_post.remove(handler)
 
 if __name__ == "__main__":
     register()
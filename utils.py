@@ -1,13 +1,46 @@
 import bpy
 import bmesh
+import os
 import sys
+import hashlib
 import socket
+import struct
 import subprocess
+import threading
+import time
+import numpy as np
+from collections import OrderedDict, deque
+from multiprocessing import shared_memory
+from concurrent.futures import Future
 from bpy_extras import view3d_utils
 from mathutils import Vector
+from mathutils.bvhtree import BVHTree
+from bpy.app.handlers import persistent
 
-bpy.types.Scene.decastel_jau   = bpy.props.BoolProperty(default=True) 
+import profiling
+
+#Curve algorithms of the engine, in the order of its spline_algorithm enum
+ALGORITHMS = ['de_casteljau_uniform', 'de_casteljau_adaptive', 'de_casteljau_classic', 'subdivision_uniform', 'subdivision_adaptive']
+UNIFORM_ALGORITHMS = ('de_casteljau_uniform', 'subdivision_uniform') #Curve samples evenly spaced in the bezier parameter
+bpy.types.Scene.algorithm = bpy.props.EnumProperty(items=[
+    ('de_casteljau_uniform', "De Casteljau", "De Casteljau, uniform subdivisions"),
+    ('de_casteljau_adaptive', "De Casteljau adaptive", "De Casteljau, subdivided until precision"),
+    ('de_casteljau_classic', "De Casteljau classic", "Classic De Casteljau construction"),
+    ('subdivision_uniform', "Subdivision", "Curve subdivision, uniform subdivisions"),
+    ('subdivision_adaptive', "Subdivision adaptive", "Curve subdivision, subdivided until precision")])
+bpy.types.Scene.precision = bpy.props.FloatProperty(min=0.0001, max=1, default=0.1, precision=4) #Threshold of the adaptive algorithms
+bpy.types.Scene.parallel = bpy.props.BoolProperty(default=True) #Segments of a batch evaluated in parallel
 bpy.types.Scene.subdivisions = bpy.props.IntProperty(min=0, max=10, default=4)
+bpy.types.Scene.binary_protocol = bpy.props.BoolProperty(default=True)
+bpy.types.Scene.engine_pool_size = bpy.props.IntProperty(min=1, max=8, default=3)
+bpy.types.Scene.shared_memory_mesh = bpy.props.BoolProperty(default=False)
+bpy.types.Scene.engine_cache_size = bpy.props.IntProperty(min=0, default=256)
+bpy.types.Scene.drag_fps = bpy.props.IntProperty(min=1, max=240, default=60)
+bpy.types.Scene.interaction_subdivisions = bpy.props.IntProperty(min=0, max=10, default=2)
+bpy.types.Scene.split_step = bpy.props.FloatProperty(min=0.001, max=0.5, default=0.02, precision=3) #Split point move per wheel tick
+bpy.types.Scene.split_arc_length = bpy.props.BoolProperty(default=False) #Split point moved by arc length of the whole curve
+bpy.types.Scene.profiling = bpy.props.BoolProperty(default=False, update=lambda scene, context: profiling.set_enabled(scene.profiling))
+bpy.types.Scene.engine_trace = bpy.props.BoolProperty(default=False) #Capture the socket traffic of new engines in bezier/data/traces
 
 #----------KEY FUNCTION----------------------------------------------------
 key_name = "geo_key"
@@ -22,10 +55,64 @@ if not hasattr(bpy.types.Scene, "total"):
     bpy.types.Scene.total = bpy.props.IntProperty(get=get_int, set=set_int)
     bpy.types.Scene.total = 0
 
+#Indices of the keys, built on the first lookup and rebuilt once they may be stale
+#Entries are checked on lookup (objects by name, since references do not survive undo)
+#A missing key rebuilds the index only if objects changed since it was built
+obj_index = {} #key -> object name
+curves_index = {} #key -> index in scene.obj_curves
+obj_index_scene = None #Name of the scene of the index, None if it must be rebuilt
+curves_index_scene = None
+obj_index_dirty = False #Objects changed since the index was built
+
+def rebuild_obj_index(scene):
+    global obj_index_scene, obj_index_dirty
+    obj_index.clear()
+    for obj in scene.objects:
+        if key_name in obj: obj_index[obj[key_name]] = obj.name
+    obj_index_scene = scene.name
+    obj_index_dirty = False
+
+def rebuild_curves_index(scene):
+    global curves_index_scene
+    curves_index.clear()
+    for i, item in enumerate(scene.obj_curves): curves_index[item.key] = i
+    curves_index_scene = scene.name
+
+def invalidate_key_index():
+    global obj_index_scene, curves_index_scene
+    obj_index_scene = None
+    curves_index_scene = None
+
+#Undo, redo and file load replace the objects and the scene data
+@persistent
+def key_index_reload(*args):
+    invalidate_key_index()
+
+#Objects added, removed, renamed or copied (keys are copied with the object)
+@persistent
+def key_index_update(scene, depsgraph):
+    global obj_index_dirty
+    if depsgraph.id_type_updated('OBJECT') or depsgraph.id_type_updated('COLLECTION') or depsgraph.id_type_updated('SCENE'):
+        obj_index_dirty = True
+
+#Set the key of an object and index it
+def set_key(obj, key):
+    obj[key_name] = key
+    if obj_index_scene == bpy.context.scene.name: obj_index[key] = obj.name
+
 def getObjByKey(key):
-    for obj in  bpy.context.scene.objects:
-        if key_name in obj and obj[key_name] == key: return obj
-    return None
+    scene = bpy.context.scene
+    if obj_index_scene != scene.name: rebuild_obj_index(scene)
+    name = obj_index.get(key)
+    if name is None:
+        if not obj_index_dirty: return None
+    else:
+        obj = scene.objects.get(name)
+        if obj is not None and obj.get(key_name) == key: return obj
+    #Stale entry or objects changed since the index was built
+    rebuild_obj_index(scene)
+    name = obj_index.get(key)
+    return None if name is None else scene.objects.get(name)
     
 
 #----------BPY WRAPPERS -------------------------------------------------
@@ -42,6 +129,8 @@ bpy.utils.register_class(BarycentriCoord)
 
 
 #Wrapper for CurveInfo 
+#Control points are packed in the "faces" (int32) and "coords" (float64, u v interleaved) custom properties,
+#see ControlPoints. points_bar holds the control points of curves saved before, converted on first access
 class CurveInfo(bpy.types.PropertyGroup):
     points_bar: bpy.props.CollectionProperty(type=BarycentriCoord)
     is_closed:  bpy.props.BoolProperty()
@@ -57,19 +146,16 @@ bpy.types.Scene.obj_curves = bpy.props.CollectionProperty(type=ObjCurvesItem)
 
 #To mimic dictionary
 def push_key(key):
-    my_item = bpy.context.scene.obj_curves.add()
+    scene = bpy.context.scene
+    my_item = scene.obj_curves.add()
     my_item.key = key
+    if curves_index_scene == scene.name: curves_index[key] = len(scene.obj_curves) - 1
 
 #TODO: join add_curve and update_curve (sharing code)
 def add_curve(key, points_bar):
     obj_item = obj_curves_get(key) 
     curve_item = obj_item.value.add()
-    
-    for p in points_bar:
-        p_bar_item = curve_item.points_bar.add()
-        p_bar_item.f = p[0]
-        p_bar_item.u = p[1][0]
-        p_bar_item.v = p[1][1]
+    ControlPoints(curve_item, points_bar)
 
 def update_curve(key, info):
     idx = key.find('o')
@@ -78,37 +164,103 @@ def update_curve(key, info):
     
     obj_item = obj_curves_get(obj_key)
     curve_item = obj_item.value[curve_idx]
-    curve_item.points_bar.clear()
     curve_item.points_idx.clear()
     #Copy barycentric coords
-    points_bar = info.points_bar
-    for p in points_bar:
-        p_bar_item = curve_item.points_bar.add()
-        p_bar_item.f = p[0]
-        p_bar_item.u = p[1][0]
-        p_bar_item.v = p[1][1]
+    ControlPoints(curve_item, info.points_bar)
     #Copy indices
     points_idx = info.points_idx
     for idx in points_idx:
         idx_item = curve_item.points_idx.add()
         idx_item.val = idx
         
-def add_point(points_bar, point):
-    p_bar_item = points_bar.add()
-    #TODO: subsitute with update point
-    p_bar_item.f = point[0]
-    p_bar_item.u = point[1][0]
-    p_bar_item.v = point[1][1]
+#Control points of a curve as packed arrays, changes are written through to the CurveInfo
+#so they are saved with the file and by undo pushes
+#Points are [f, [u, v]] lists or point records (POINT_DTYPE), the wire formats
+class ControlPoints:
+    def __init__(self, curve_item, points = None):
+        self.item = curve_item
+        if points is not None: 
+            self.faces, self.coords = point_arrays(points)
+            self.save()
+        elif "faces" in curve_item:
+            self.faces = np.array(curve_item["faces"], dtype=np.int32)
+            self.coords = np.array(curve_item["coords"], dtype=np.float64).reshape(-1, 2)
+        else:
+            #Curve saved with a points_bar collection
+            legacy = curve_item.points_bar
+            self.faces = np.array([p.f for p in legacy], dtype=np.int32)
+            self.coords = np.array([(p.u, p.v) for p in legacy], dtype=np.float64).reshape(-1, 2)
+            self.save()
+            legacy.clear()
+    
+    def __len__(self):
+        return len(self.faces)
+    
+    def get(self, i):
+        return [int(self.faces[i]), [float(self.coords[i, 0]), float(self.coords[i, 1])]]
+    
+    #Output: list of points of the indices
+    def points(self, indices):
+        return [self.get(i) for i in indices]
+    
+    #Output: point records of the range, as sent to the engine and read by convert_coords
+    def records(self, start = 0, stop = None):
+        faces = self.faces[start:stop]
+        records = np.empty(len(faces), dtype=POINT_DTYPE)
+        records['f'] = faces
+        records['u'] = self.coords[start:stop, 0]
+        records['v'] = self.coords[start:stop, 1]
+        return records
+    
+    def set(self, i, point):
+        i %= len(self.faces)
+        f, (u, v) = point
+        self.faces[i] = f
+        self.coords[i] = u, v
+        self.item["faces"][i] = int(f)
+        coords = self.item["coords"]
+        coords[2*i] = u
+        coords[2*i + 1] = v
+    
+    #Replace count points from start with points
+    def replace(self, start, count, points):
+        faces, coords = point_arrays(points)
+        self.faces = np.concatenate((self.faces[:start], faces, self.faces[start + count:]))
+        self.coords = np.concatenate((self.coords[:start], coords, self.coords[start + count:]))
+        self.save()
+    
+    def insert(self, i, points):
+        self.replace(i, 0, points)
+    
+    def append(self, points):
+        self.replace(len(self.faces), 0, points)
+        
+    def remove(self, start, count = 1):
+        self.replace(start, count, [])
     
-def update_point(p_bar_item, point):
-    p_bar_item.f = point[0]
-    p_bar_item.u = point[1][0]
-    p_bar_item.v = point[1][1]
+    def save(self):
+        self.item["faces"] = self.faces
+        self.item["coords"] = self.coords.ravel()
+
+#Output: faces (N) and coords (N,2) arrays of points
+def point_arrays(points):
+    if isinstance(points, np.ndarray) and points.dtype.names is not None:
+        return points['f'].astype(np.int32), np.stack((points['u'], points['v']), axis=1).astype(np.float64)
+    faces = np.array([p[0] for p in points], dtype=np.int32)
+    coords = np.array([p[1] for p in points], dtype=np.float64).reshape(-1, 2)
+    return faces, coords
 
 def obj_curves_get(key):
-    for item in bpy.context.scene.obj_curves:
-        if item.key == key: return item
-    return None
+    scene = bpy.context.scene
+    if curves_index_scene != scene.name: rebuild_curves_index(scene)
+    idx = curves_index.get(key)
+    #Items are only added by push_key, which indexes them
+    if idx is None: return None
+    if idx < len(scene.obj_curves) and scene.obj_curves[idx].key == key: return scene.obj_curves[idx]
+    #Stale entry
+    rebuild_curves_index(scene)
+    idx = curves_index.get(key)
+    return None if idx is None else scene.obj_curves[idx]
 
 def print_obj_curves():
     print("Number of context geo objs: ",  len(bpy.context.scene.obj_curves))
@@ -122,58 +274,449 @@ class ServerCommunication:
         self.s = None #Socket
         self.process = None #Subprocess for c++ engine
         self.obj_key = None #Name of the current working object
+        self.port = None #Port of the engine
+        self.ready = None #Future resolved once the engine accepts requests
+        self.launch_time = None #Time of the launch, for startup latency
+        self.trace = None #TraceWriter of the socket traffic if captured
+        self.digest = None #Content hash of the mesh loaded by the engine
+
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+
+#Resident engines, one per recently used target mesh
+class EnginePool:
+    def __init__(self):
+        self.engines = OrderedDict() #obj_key -> ServerCommunication, least recently used first
+        
+    #Engine working on key if still running, None otherwise
+    def get(self, key):
+        comm = self.engines.get(key)
+        if comm is None: return None
+        if comm.obj_key != key or not comm.is_alive():
+            #Reset or crashed engine
+            del self.engines[key]
+            return None
+        self.engines.move_to_end(key)
+        return comm
+    
+    #Add engine and close the least recently used ones over the limit
+    def add(self, comm, limit):
+        self.engines[comm.obj_key] = comm
+        self.engines.move_to_end(comm.obj_key)
+        while len(self.engines) > limit:
+            _, old = self.engines.popitem(last=False)
+            try: close_spline_server(old)
+            except: pass
+        
+    #Close the engine of key
+    def remove(self, key):
+        comm = self.engines.pop(key, None)
+        if comm is None: return
+        try: close_spline_server(comm)
+        except: pass
+        
+    def close_all(self):
+        while self.engines:
+            _, old = self.engines.popitem(last=False)
+            try: close_spline_server(old)
+            except: pass
+
+#Protocol spoken by the running engine, fixed when the engine is launched
+wire_binary = False
+ENGINE_TIMEOUT = 10.0 #Seconds waited for an engine answer before the request fails
 
 #Create TCP socket for geodesic spline calculations                
-def create_socket():
+def create_socket(port = 27015):
     HOST = "127.0.0.1"  # The server's hostname or IP address
-    PORT = 27015  # The port used by the server
 
     sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    sock.connect((HOST, PORT))
+    sock.connect((HOST, port))
     return sock
 
-#Run C++ engine in subprocess    
-def run_spline_server(directory, comm):
-    command = directory + "/bezier/bin/splinegui"
-    mesh = directory + "/bezier/data/tmp.obj"
-    comm.process = subprocess.Popen([command, mesh], 
+#Run C++ engine in subprocess without blocking the caller
+#The engine binds a free port and reports it with a "ready <port>" line once the mesh is loaded
+#Input: mesh file for the engine (tmp.obj if not given), content hash for the engine cache,
+#       engine command line (bezier/bin/splinegui if not given)
+#Output: future resolved with comm once the socket is connected
+def start_spline_server(directory, comm, mesh = None, digest = None, command = None):
+    global wire_binary
+    if command is None: command = [directory + "/bezier/bin/splinegui"]
+    if mesh is None: mesh = directory + "/bezier/data/tmp.obj"
+    args = command + [mesh, "--port", "0"]
+    if digest is not None:
+        #The engine reuses the preprocessing of a mesh with the same content
+        cache = os.path.join(directory, "bezier", "data", "cache")
+        os.makedirs(cache, exist_ok=True)
+        args += ["--cache", cache, "--hash", digest, "--cache-size", str(bpy.context.scene.engine_cache_size)]
+    wire_binary = bpy.context.scene.binary_protocol
+    if wire_binary: args.append("--binary")
+    if bpy.context.scene.engine_trace:
+        traces = os.path.join(directory, "bezier", "data", "traces")
+        os.makedirs(traces, exist_ok=True)
+        name = time.strftime("trace_%Y%m%d_%H%M%S_") + str(os.getpid()) + "_" + str(id(comm)) + ".gtrc"
+        comm.trace = TraceWriter(os.path.join(traces, name), wire_binary, digest)
+    comm.ready = Future()
+    comm.launch_time = time.perf_counter()
+    comm.process = subprocess.Popen(args, 
         universal_newlines=True,
         stdout=subprocess.PIPE
         )
- 
-    line = comm.process.stdout.readline()
-    line = comm.process.stdout.readline()
-    print("Waited for line ", line)
-    comm.s = create_socket()
-    print("New socket: ", comm.s)
+    threading.Thread(target=wait_spline_server, args=(comm, comm.process, comm.ready, wire_binary), daemon=True).start()
+    return comm.ready
+
+#Wait for the readiness line of the engine, connect and keep draining its output
+def wait_spline_server(comm, process, ready, binary):
+    try:
+        for line in process.stdout:
+            if line.startswith("ready "):
+                comm.port = int(line.split()[1])
+                sock = create_socket(comm.port)
+                #Text answers are read with blocking recv calls, a lost answer fails the request
+                if not binary: sock.settimeout(ENGINE_TIMEOUT)
+                if comm.trace is not None: sock = TracingSocket(sock, comm.trace)
+                if binary: clients[sock] = AsyncClient(sock)
+                comm.s = sock
+                print("Engine ready in %.3fs, new socket: " % (time.perf_counter() - comm.launch_time), comm.s)
+                ready.set_result(comm)
+                break
+        else: raise RuntimeError("engine exited before being ready")
+    except Exception as e:
+        ready.set_exception(e)
+        return
+    #Engine logs are discarded, an unread pipe would block the engine once full
+    for line in process.stdout: pass
+
+#Run C++ engine in subprocess and wait until it is ready
+def run_spline_server(directory, comm, mesh = None, digest = None, command = None):
+    start_spline_server(directory, comm, mesh, digest, command).result()
 
 #Kill C++ engine subprocess   
 def close_spline_server(comm):
-    comm.s.sendall(b"a\n")
+    if comm.s is not None: #Still loading otherwise
+        if wire_binary: send_frame(comm.s, b"a")
+        else: comm.s.sendall(b"a\n")
     reset_spline_server(comm)
     
 def reset_spline_server(comm):
+    clear_mesh_snapshots()
     try: comm.process.kill()
     except: pass
     comm.process = None
-    comm.s.shutdown(socket.SHUT_RDWR)
-    comm.s.close()
     comm.obj_key = None
-    print("Closed socket: ", comm.s)
-
-#Save mesh in tmp.obj that will be the input for the C++ engine
-#Needed to keep data structure alligned with the C++ engine
-def save_file(mesh, name): 
-    with open(name, 'w+') as f1:
-        for p in mesh.vertices:
-            coord = p.co
-            f1.write("v " +  str(coord[0]) + " " + str(coord[1]) + " " + str(coord[2]) + "\n" )
-        for f in mesh.polygons:
-            v1, v2, v3 = f.vertices 
-            f1.write("f " + str(v1+1) + " " + str(v2+1) + " " + str(v3+1) + "\n")      
+    #Before the socket, closed even if the connection is already broken
+    if comm.trace is not None:
+        comm.trace.close()
+        print("Engine trace saved: ", comm.trace.path)
+        comm.trace = None
+    if comm.s is not None:
+        clients.pop(comm.s, None)
+        with path_lock: path_caches.pop(comm.s, None)
+        comm.s.shutdown(socket.SHUT_RDWR)
+        comm.s.close()
+        print("Closed socket: ", comm.s)
+
+#Binary mesh for the C++ engine: magic, number of vertices and triangles (uint32), float32 vertices, int32 triangles
+MESH_HEADER = struct.Struct('<4sII')
+MESH_EXPORTS_KEPT = 8 #Exported meshes kept in the data directory
+
+#Content hash of the mesh geometry
+def mesh_digest(mesh):
+    verts, tris = mesh_snapshot(mesh)
+    digest = hashlib.blake2b(verts.tobytes(), digest_size=16)
+    digest.update(tris.tobytes())
+    return digest.hexdigest()
+
+#Save mesh in a binary file named by the content hash of the geometry
+#An unchanged mesh is not exported again
+#Output: path of the mesh file
+def export_mesh(mesh, directory):
+    verts, tris = mesh_snapshot(mesh)
+    name = os.path.join(directory, "mesh_" + mesh_digest(mesh) + ".bin")
+    if os.path.exists(name): 
+        os.utime(name) #Mark as recently used
+    else:
+        header = MESH_HEADER.pack(b"GMSH", len(verts), len(tris))
+        with open(name + ".tmp", 'wb') as f:
+            f.write(b"".join((header, verts.tobytes(), tris.tobytes())))
+        os.replace(name + ".tmp", name)
+        prune_exports(directory)
+    return name
+
+#Remove the least recently used exported meshes
+def prune_exports(directory, keep = MESH_EXPORTS_KEPT):
+    exports = [os.path.join(directory, f) for f in os.listdir(directory) if f.startswith("mesh_") and f.endswith(".bin")]
+    exports.sort(key=os.path.getmtime, reverse=True)
+    for name in exports[keep:]:
+        try: os.remove(name)
+        except OSError: pass
+
+#Copy the mesh in a shared memory block with the layout of the binary mesh file
+#The engine maps the block by name, the caller releases it once the engine is ready
+#Output: shared memory block
+def share_mesh(mesh):
+    verts, tris = mesh_snapshot(mesh)
+    header = MESH_HEADER.pack(b"GMSH", len(verts), len(tris))
+    shm = shared_memory.SharedMemory(create=True, size=len(header) + verts.nbytes + tris.nbytes)
+    offset = len(header)
+    shm.buf[:offset] = header
+    shm.buf[offset:offset + verts.nbytes] = memoryview(verts).cast('B')
+    offset += verts.nbytes
+    shm.buf[offset:offset + tris.nbytes] = memoryview(tris).cast('B')
+    return shm
+
+def release_mesh(shm):
+    shm.close()
+    try: shm.unlink()
+    except FileNotFoundError: pass
+            
+#----------BINARY WIRE PROTOCOL--------------------------------------------
+#Frame: header (payload size, opcode, flag, request id, record count, scalar param) followed by packed point records
+#Opcodes are the letters of the text protocol, 'c' is the curve request
+#The engine answers with frames carrying the id of the request
+FRAME_HEADER = struct.Struct('<IcBHid')
+POINT_DTYPE  = np.dtype([('f', '<i4'), ('u', '<f8'), ('v', '<f8')])
+
+#Answer frames of each request, 'm' is answered with one frame per segment (4 control points)
+def answer_frames(op, count):
+    if op in (b"o", b"a"): return 0
+    if op == b"m": return count // 4
+    return 1
+
+def send_frame(sock, op, points_bar = (), flag = 0, param = 0.0):
+    client = clients.get(sock)
+    if client is not None: return client.send(op, points_bar, flag, param)
+    write_frame(sock, op, points_bar, flag, param)
+
+#Output: point records of [f, [u, v]] points, record arrays are returned as they are
+def point_records(points_bar):
+    if isinstance(points_bar, np.ndarray): return points_bar.astype(POINT_DTYPE, copy=False)
+    return np.array([(p[0], p[1][0], p[1][1]) for p in points_bar], dtype=POINT_DTYPE)
+
+def write_frame(sock, op, points_bar = (), flag = 0, param = 0.0, request_id = 0):
+    records = point_records(points_bar)
+    payload = records.tobytes()
+    sock.sendall(FRAME_HEADER.pack(len(payload), op, flag, request_id, len(records), param) + payload)
+
+#Read exactly size bytes from the socket
+def recv_exact(sock, size):
+    buf = bytearray(size)
+    view = memoryview(buf)
+    pos = 0
+    while pos < size:
+        n = sock.recv_into(view[pos:], size - pos)
+        if n == 0: raise ConnectionError("Engine closed the connection")
+        pos += n
+    return buf
+
+#Output: opcode, flag, scalar param and points as a structured array (f, u, v)
+def recv_frame(sock):
+    client = clients.get(sock)
+    if client is not None: return client.recv()
+    return read_frame(sock)[1]
+
+#Output: request id and frame
+def read_frame(sock):
+    size, op, flag, request_id, count, param = FRAME_HEADER.unpack(recv_exact(sock, FRAME_HEADER.size))
+    points = np.frombuffer(recv_exact(sock, size), dtype=POINT_DTYPE, count=count)
+    return request_id, (op, flag, param, points)
+
+#----------TRAFFIC CAPTURE-----------------------------------------------------
+#Trace: header (magic, version, binary protocol flag, mesh content hash) followed by records
+#Record: direction ('>' sent, '<' received), seconds since the capture start, payload size, payload
+#Sent records are the requests as written in one sendall, received records the chunks returned by recv
+#Replayed against an engine by benchmarks/replay.py
+TRACE_HEADER = struct.Struct('<4sBB32s')
+TRACE_RECORD = struct.Struct('<cdI')
+TRACE_VERSION = 2 #Text params acknowledged by the engine since version 2
+
+class TraceWriter:
+    def __init__(self, path, binary, digest = None):
+        self.path = path
+        self.lock = threading.Lock() #Requests and answers are recorded from different threads
+        self.file = open(path, 'wb')
+        self.file.write(TRACE_HEADER.pack(b"GTRC", TRACE_VERSION, int(binary), (digest or "").encode()))
+        self.start = time.perf_counter()
+        
+    def record(self, direction, data):
+        t = time.perf_counter() - self.start
+        with self.lock:
+            if self.file is None: return
+            self.file.write(TRACE_RECORD.pack(direction, t, len(data)))
+            self.file.write(data)
+            #Records reach the file as they come, the trace stays readable if Blender exits without closing it
+            self.file.flush()
             
+    def close(self):
+        with self.lock:
+            if self.file is None: return
+            self.file.close()
+            self.file = None
+
+#Socket recording the traffic in a trace, other methods go to the wrapped socket
+class TracingSocket:
+    def __init__(self, sock, trace):
+        self.sock = sock
+        self.trace = trace
+        
+    def sendall(self, data):
+        self.trace.record(b">", data)
+        self.sock.sendall(data)
+        
+    def recv(self, size):
+        data = self.sock.recv(size)
+        self.trace.record(b"<", data)
+        return data
+    
+    def recv_into(self, buf, size = 0):
+        n = self.sock.recv_into(buf, size)
+        self.trace.record(b"<", bytes(buf[:n]))
+        return n
+    
+    def __getattr__(self, name):
+        return getattr(self.sock, name)
+
+#----------PIPELINED CLIENT----------------------------------------------------
+#Binary protocol client with several requests outstanding at once
+#Requests are tagged with an id, a reader thread resolves the future of each request with its answer frames
+#Blocking calls (send_frame then recv_frame) go through the same client, answered in the order they were sent
+class AsyncClient:
+    def __init__(self, sock):
+        self.sock = sock
+        self.lock = threading.Lock()
+        self.next_id = 0
+        self.pending = {} #request id -> [future, expected frames, received frames, opcode, send time]
+        self.blocking = deque() #[future, next frame to return] of the blocking calls, oldest first
+        self.error = None #Set once the connection is lost
+        threading.Thread(target=self.read_loop, daemon=True).start()
+        
+    #Send request without waiting
+    #Output: future resolved with the list of answer frames
+    def submit(self, op, points_bar = (), flag = 0, param = 0.0):
+        future = Future()
+        frames = answer_frames(op, len(points_bar))
+        with self.lock:
+            if self.error is not None: raise ConnectionError("Engine closed the connection")
+            request_id = self.next_id
+            self.next_id = (self.next_id + 1) % 65536
+            if frames > 0: self.pending[request_id] = [future, frames, [], op, time.perf_counter()]
+            #Sent under the lock, ids reach the engine in order
+            write_frame(self.sock, op, points_bar, flag, param, request_id)
+        if frames == 0: future.set_result([])
+        return future
+    
+    def send(self, op, points_bar = (), flag = 0, param = 0.0):
+        future = self.submit(op, points_bar, flag, param)
+        if answer_frames(op, len(points_bar)) > 0: self.blocking.append([future, 0])
+        
+    #Next answer frame of the blocking calls
+    def recv(self):
+        entry = self.blocking[0]
+        frames = entry[0].result(ENGINE_TIMEOUT)
+        frame = frames[entry[1]]
+        entry[1] += 1
+        if entry[1] == len(frames): self.blocking.popleft()
+        return frame
+        
+    def read_loop(self):
+        try:
+            while True:
+                request_id, frame = read_frame(self.sock)
+                with self.lock: entry = self.pending.get(request_id)
+                if entry is None: continue
+                if frame[0] == b"e":
+                    #Request unknown to the engine
+                    with self.lock: del self.pending[request_id]
+                    entry[0].set_exception(ValueError("Request '" + entry[3].decode() + "' rejected by the engine"))
+                    continue
+                entry[2].append(frame)
+                if len(entry[2]) == entry[1]:
+                    with self.lock: del self.pending[request_id]
+                    profiling.record("engine " + entry[3].decode(), time.perf_counter() - entry[4])
+                    entry[0].set_result(entry[2])
+        except Exception as e:
+            with self.lock:
+                self.error = e
+                pending = list(self.pending.values())
+                self.pending.clear()
+            for entry in pending: entry[0].set_exception(ConnectionError("Engine closed the connection"))
+
+#Pipelined clients of the binary engines, keyed by socket
+clients = {}
+
+#Future resolved with fn applied to the result of future (in the thread resolving it)
+def chain(future, fn):
+    out = Future()
+    def resolve(f):
+        try: out.set_result(fn(f.result()))
+        except Exception as e: out.set_exception(e)
+    future.add_done_callback(resolve)
+    return out
+
+#Future of a blocking call, used where requests cannot be pipelined (text protocol)
+def completed(fn):
+    future = Future()
+    try: future.set_result(fn())
+    except Exception as e: future.set_exception(e)
+    return future
+
+def record_to_point(points):
+    f, u, v = points[0]
+    return [int(f), [float(u), float(v)]]
+
+#Send request without waiting for the answer
+#Output: future of the list of answer frames
+def request(sock, op, points_bar = (), flag = 0, param = 0.0):
+    return clients[sock].submit(op, points_bar, flag, param)
+
+#Input: segments as lists of 4 points or point records
+#Output: future of the polylines (barycentric coords) of the segments, see curves_to_world
+def request_curves(sock, segments):
+    if len(segments) == 0: return completed(lambda: [])
+    if sock not in clients: 
+        return completed(lambda: [send_point_bar(sock, segment) or recv_points(sock)[0] for segment in segments])
+    return chain(request(sock, b"m", np.concatenate([point_records(segment) for segment in segments])), lambda frames: [frame[3] for frame in frames])
+
+#Output: future of the rotated tangent point
+def request_rotate_tan(sock, p0, p1, p2, end):
+    if sock not in clients: return completed(lambda: send_rotate_tan(sock, p0, p1, p2, end) or recv_point(sock))
+    return chain(request(sock, b"r", [p0, p1, p2], flag=end), lambda frames: record_to_point(frames[0][3]))
+
+#Output: future of the path (barycentric coords) between two points
+#Paths are cached, the tangent handles are redrawn on every pick and mouse move with mostly unchanged endpoints
+def request_straight_path(sock, p1, p2):
+    key = segment_key([p1, p2])
+    path = cached_path(sock, key)
+    if path is not None: return completed(lambda: path)
+    if sock not in clients: return completed(lambda: cache_path(sock, key, get_straight_path(sock, None, p1, p2)))
+    return chain(request(sock, b"l", [p1, p2]), lambda frames: cache_path(sock, key, frames[0][3]))
+
+#----------PATH CACHE---------------------------------------------------------
+#Least recently used geodesic paths of each engine, keyed by socket then by the endpoints
+#An engine serves a single mesh, its paths are dropped with it in reset_spline_server
+PATH_CACHE_SIZE = 512 #Paths kept per engine
+path_caches = {} #socket -> OrderedDict (endpoints key -> path), least recently used first
+path_lock = threading.Lock() #Paths are stored by the reader thread of the engine
+
+def cached_path(sock, key):
+    with path_lock:
+        cache = path_caches.get(sock)
+        if cache is None or key not in cache: return None
+        cache.move_to_end(key)
+        return cache[key]
+
+def cache_path(sock, key, path):
+    with path_lock:
+        cache = path_caches.setdefault(sock, OrderedDict())
+        cache[key] = path
+        cache.move_to_end(key)
+        if len(cache) > PATH_CACHE_SIZE: cache.popitem(last=False)
+    return path
+
+#----------REQUESTS---------------------------------------------------------
 #Send control points in barycentric coords to server
 def send_point_bar(sock, points_bar):
+    if wire_binary: return send_frame(sock, b"c", points_bar)
+    if isinstance(points_bar, np.ndarray): points_bar = [[f, [u, v]] for f, u, v in points_bar.tolist()]
     send = ""
     for point in points_bar:
         send += pbar2str(point)
@@ -181,32 +724,69 @@ def send_point_bar(sock, points_bar):
     
 #Send final two points of current polygon and new one
 def send_tan_extension(sock, p1, p2):
+    if wire_binary: return send_frame(sock, b"n", [p1, p2])
     send = "n\n"
-    send += pbar2str( p1.get() ) #For tangent calculation
-    send += pbar2str( p2.get() ) #Start point of the new curve
+    send += pbar2str( p1 ) #For tangent calculation
+    send += pbar2str( p2 ) #Start point of the new curve
+    sock.sendall(send.encode())
+
+#Send anchor p1 between tangents p0 and p2, end selects the tangent to rotate
+def send_rotate_tan(sock, p0, p1, p2, end):
+    if wire_binary: return send_frame(sock, b"r", [p0, p1, p2], flag=end)
+    send = "r" + str(end) + "\n"
+    send += pbar2str( p0 ) 
+    send += pbar2str( p1 ) 
+    send += pbar2str( p2 ) 
     sock.sendall(send.encode())
 
 def send_point_eval(sock, points_bar, t0):
+    if wire_binary: return send_frame(sock, b"p", points_bar, param=t0)
     send = "p\n" + str(t0) + "\n"
     for point in points_bar:
         send += pbar2str(point)
     sock.sendall(send.encode())
 
 def send_split(sock, points_bar, t0):
+    if wire_binary: return send_frame(sock, b"s", points_bar, param=t0)
     send = "s\n" + str(t0) + "\n"
     for point in points_bar:
         send += pbar2str(point)
     sock.sendall(send.encode())
+
+#Set curve algorithm, number of subdivisions, adaptive precision and parallel evaluation
+def send_params(sock, algorithm, subdivisions, precision = 0.1, parallel = True):
+    if wire_binary: 
+        #Algorithm index in flag, subdivisions in param, one record with the parallel flag and the precision
+        return send_frame(sock, b"o", [[int(parallel), [precision, 0.0]]], flag=ALGORITHMS.index(algorithm), param=subdivisions)
+    send = "o" + str(ALGORITHMS.index(algorithm)) + "\n"
+    send += str( subdivisions ) + "\n"
+    send += str( precision ) + "\n"
+    send += str( int(parallel) ) + "\n"
+    sock.sendall(send.encode())
+    #The engine reads a text request per recv, the next request waits for the params to be acknowledged
+    if sock.recv(16).decode().strip() != "o": raise ConnectionError("Engine did not acknowledge the params")
     
 def pbar2str(point):
     face, coord = point
     return str(face) + "\n" + str(coord[0]) + "\n" + str(coord[1]) + "\n" 
 
+#Read single point answer (tangent extension, rotation, evaluation) in barycentric coords
+@profiling.timed("recv_point")
+def recv_point(sock):
+    if wire_binary: return record_to_point(recv_frame(sock)[3])
+    new_control = sock.recv(2048).decode().splitlines()[0].split()
+    return [int(new_control[0]), [float(new_control[1]), float(new_control[2])]]
+
 #Read single polyline from the server
 #Input: obj if want the points in 3d coords (barycentric otherwise), remaining data if present (for successive read calls)
 #Output: polyline in barycentric coordinates and remaining data if present (for successive read calls)
 #Note: remainder variable needed only if need to read multiple consecutive polylines
+#Note: with the binary protocol the polyline is a structured array (f, u, v) and no remainder is needed
+@profiling.timed("recv_points")
 def recv_points(sock, remainders = (None, [])):
+    if wire_binary: 
+        _, _, _, poly = recv_frame(sock)
+        return poly, remainders
     poly = []
     n = -1
     #Line_remainder: if row has been separated in two different messages
@@ -249,19 +829,41 @@ def recv_points(sock, remainders = (None, [])):
     #print("Finished reading")
     return poly, (line_remainder, data_remainder)
 
+@profiling.timed("get_straight_path")
 def get_straight_path(sock, obj, p1, p2):
-    send = "l\n"
-    send += pbar2str( p1 )
-    send += pbar2str( p2 )
-    sock.sendall(send.encode())
+    if wire_binary: send_frame(sock, b"l", [p1, p2])
+    else:
+        send = "l\n"
+        send += pbar2str( p1 )
+        send += pbar2str( p2 )
+        sock.sendall(send.encode())
     path, _ = recv_points(sock)
     return path
 
+#Hashable key of a bezier segment from its control points [f, [u, v]]
+def segment_key(points_bar):
+    return tuple((int(f), float(u), float(v)) for f, (u, v) in points_bar)
+
+@profiling.timed("get_curve")
 def get_curve(sock, obj, points_bar):
     send_point_bar(sock, points_bar)
     curve, _ = recv_points(sock)
-    convert_coords(obj, curve)
-    return curve
+    return convert_coords(obj, curve)
+
+#Curves of several segments in one round trip, evaluated in parallel by the engine
+#Input: list of segments (4 control points in barycentric coords each)
+#Output: list of polylines in 3d coords
+#Note: the text protocol has no batch request, segments are sent one by one
+@profiling.timed("get_curves")
+def get_curves(sock, obj, segments):
+    if not wire_binary: return [get_curve(sock, obj, segment) for segment in segments]
+    return curves_to_world(obj, request_curves(sock, segments).result(ENGINE_TIMEOUT))
+
+#Convert all the polylines at once
+def curves_to_world(obj, polys):
+    if len(polys) == 0: return []
+    world = convert_coords(obj, np.concatenate([np.asarray(poly) for poly in polys]))
+    return np.split(world, np.cumsum([len(poly) for poly in polys])[:-1])
 
 #Receive polygon and curve
 #OUTPUT: control polygon points idx in the mesh, control points idx in the previous list, curve points idx
@@ -309,18 +911,181 @@ def obj_to_world(ob, p):
     mesh = ob.data
     return mat@p
 """
-#Convert list of points in barycentric coordinates in 3d points
+#----------MESH SNAPSHOT----------------------------------------------------------
+#Vertex coordinates and triangle indices of the target meshes, keyed by mesh pointer
+#Taken once per mesh, dropped on a geometry update of the mesh (mesh_snapshot_update), on undo, redo
+#and file load, and when the engine is restarted on a new export
+mesh_snapshots = {}
+
+def mesh_snapshot(mesh):
+    key = mesh.as_pointer()
+    snap = mesh_snapshots.get(key)
+    if snap is None or len(snap[0]) != len(mesh.vertices) or len(snap[1]) != len(mesh.polygons):
+        verts = np.empty(len(mesh.vertices)*3, dtype=np.float32)
+        mesh.vertices.foreach_get("co", verts)
+        loop_total = np.empty(len(mesh.polygons), dtype=np.int32)
+        mesh.polygons.foreach_get("loop_total", loop_total)
+        if (loop_total != 3).any(): raise ValueError("Mesh " + mesh.name + " is not triangulated")
+        loop_start = np.empty(len(mesh.polygons), dtype=np.int32)
+        mesh.polygons.foreach_get("loop_start", loop_start)
+        loops = np.empty(len(mesh.loops), dtype=np.int32)
+        mesh.loops.foreach_get("vertex_index", loops)
+        #Triangulated mesh: three consecutive loops per polygon
+        tris = loops[loop_start[:, None] + np.arange(3)]
+        snap = (verts.reshape(-1, 3), tris)
+        mesh_snapshots[key] = snap
+    return snap
+
+def clear_mesh_snapshots():
+    mesh_snapshots.clear()
+    mesh_trees.clear()
+
+#Snapshot and BVH tree of a mesh, taken again on the next use
+def drop_mesh_snapshot(mesh):
+    key = mesh.as_pointer()
+    mesh_snapshots.pop(key, None)
+    mesh_trees.pop(key, None)
+
+#Vertices moved or geometry replaced, also with the same topology
+@persistent
+def mesh_snapshot_update(scene, depsgraph):
+    for update in depsgraph.updates:
+        if not update.is_updated_geometry: continue
+        data = update.id.original
+        if isinstance(data, bpy.types.Object): data = data.data
+        if isinstance(data, bpy.types.Mesh): drop_mesh_snapshot(data)
+
+#Undo, redo and file load replace the mesh data
+@persistent
+def mesh_snapshot_reload(*args):
+    clear_mesh_snapshots()
+
+#BVH trees of the target meshes, dropped with the snapshot of the mesh and rebuilt when it is taken again
+mesh_trees = {}
+
+def mesh_tree(mesh):
+    snap = mesh_snapshot(mesh)
+    key = mesh.as_pointer()
+    cached = mesh_trees.get(key)
+    if cached is None or cached[0] is not snap:
+        verts, tris = snap
+        cached = (snap, BVHTree.FromPolygons(verts.tolist(), tris.tolist()))
+        mesh_trees[key] = cached
+    return cached[1]
+
+#Convert points in barycentric coordinates (f, u, v) in 3d points
+#Input: list of (f, u, v) or structured array from recv_points
+#Output: (N,3) array of world coordinates
+@profiling.timed("convert_coords")
 def convert_coords(ob, points):
-    mat = ob.matrix_world
-    mesh = ob.data
+    verts, tris = mesh_snapshot(ob.data)
+    if isinstance(points, np.ndarray) and points.dtype.names is not None:
+        faces, a, b = points['f'], points['u'], points['v']
+    else:
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        faces, a, b = points[:, 0].astype(np.int64), points[:, 1], points[:, 2]
+    corners = verts[tris[faces]] #(N,3,3) gather of the triangle vertices
+    local = corners[:, 0]*(1-a-b)[:, None] + corners[:, 1]*a[:, None] + corners[:, 2]*b[:, None]
+    mat = np.array(ob.matrix_world)
+    return local @ mat[:3, :3].T + mat[:3, 3]
+
+#Region coords of the control points of a curve, projected in one batch
+#Projection is recomputed only when the view, the object transform or the points change
+class PickIndex:
+    def __init__(self):
+        self.view_key = None
+        self.points_key = None
+        self.coords = None #(N,3) world coords of the control points
+        self.screen = None #(N,2) region coords, nan behind the view
+        
+    def update(self, ob, points_bar, region, region_3d):
+        points_key = (points_bar.faces.tobytes(), points_bar.coords.tobytes(), tuple(map(tuple, ob.matrix_world)))
+        view_key = (tuple(map(tuple, region_3d.perspective_matrix)), region.width, region.height)
+        if points_key != self.points_key:
+            self.coords = convert_coords(ob, points_bar.records())
+            self.points_key = points_key
+            self.view_key = None
+        if view_key != self.view_key:
+            #Same projection as view3d_utils.location_3d_to_region_2d
+            persp = np.array(region_3d.perspective_matrix)
+            prj = self.coords @ persp[:, :3].T + persp[:, 3]
+            w = prj[:, 3]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                self.screen = np.stack((region.width/2 * (1 + prj[:, 0]/w), region.height/2 * (1 + prj[:, 1]/w)), axis=1)
+            self.screen[w <= 0] = np.nan
+            self.view_key = view_key
+            
+    #Indices among candidates within radius of point_2d, nearest first
+    def nearest(self, point_2d, candidates, radius):
+        candidates = np.asarray(candidates, dtype=np.int64)
+        dist = np.linalg.norm(self.screen[candidates] - np.asarray(point_2d, dtype=np.float64), axis=1)
+        inside = dist < radius #False for nan
+        candidates, dist = candidates[inside], dist[inside]
+        #On ties the last control point wins
+        order = np.lexsort((-candidates, dist))
+        return candidates[order]
+
+#Cumulative arc length of the evaluated segments of a curve
+#Positions on the curve are t in [0, number of segments]: segment int(t) at the bezier parameter t - int(t)
+#Note: within a segment the length is taken as linear in the parameter, exact only at the segment ends
+class ArcLengthTable:
+    def __init__(self, segments):
+        self.segments = [np.asarray(segment, dtype=np.float64).reshape(-1, 3) for segment in segments]
+        #Length from the start of the segment of each polyline point
+        self.lengths = [np.concatenate(([0.0], np.cumsum(np.linalg.norm(np.diff(segment, axis=0), axis=1)))) for segment in self.segments]
+        totals = np.array([lengths[-1] for lengths in self.lengths])
+        self.offsets = np.concatenate(([0.0], np.cumsum(totals))) #Length at the start of each segment
+        self.total = self.offsets[-1]
+        
+    #Output: segment index and fraction of t
+    def locate(self, t):
+        t = min(max(t, 0.0), len(self.segments))
+        i = min(int(t), len(self.segments) - 1)
+        return i, t - i
+    
+    #Arc length from the start of the curve at t
+    def arc_length(self, t):
+        i, fraction = self.locate(t)
+        return self.offsets[i] + fraction * (self.offsets[i+1] - self.offsets[i])
     
-    for i in range(len(points)):
-        face_idx, a, b = points[i]
-        face = mesh.polygons[face_idx]
-        v1, v2, v3 = face.vertices
-        points[i] = mat@(mesh.vertices[v1].co*(1-a-b) + mesh.vertices[v2].co*a + mesh.vertices[v3].co*b)
+    #Position at the arc length s from the start of the curve
+    def param(self, s):
+        s = min(max(s, 0.0), self.total)
+        i = min(max(int(np.searchsorted(self.offsets, s, side='right')) - 1, 0), len(self.segments) - 1)
+        length = self.offsets[i+1] - self.offsets[i]
+        return i + ((s - self.offsets[i]) / length if length > 0 else 0.0)
+    
+    #Point of the segment i at the fraction of its length
+    def point_at(self, i, fraction):
+        lengths = self.lengths[i]
+        return polyline_point(self.segments[i], np.interp(fraction * lengths[-1], lengths, np.arange(len(lengths))))
+
+#Point of a polyline at the fractional sample index x, interpolated between the two samples around it
+def polyline_point(points, x):
+    k = min(max(int(x), 0), len(points) - 2)
+    w = min(max(x - k, 0.0), 1.0)
+    return points[k] * (1 - w) + points[k+1] * w
 
 #----------EDITING UTILS--------------------------------------------------------
+#Write all the points of a POLY spline with one bulk copy
+#Input: coords (N,3), the spline is grown to N points (never shrunk)
+@profiling.timed("set_poly_points")
+def set_poly_points(poly, coords):
+    coords = np.asarray(coords, dtype=np.float32).reshape(-1, 3)
+    n = len(coords)
+    if len(poly.points) < n: poly.points.add(n - len(poly.points))
+    #foreach_set writes every point, a longer spline would keep stale points
+    assert len(poly.points) == n, "spline has %d points, %d coords given" % (len(poly.points), n)
+    co = np.ones((n, 4), dtype=np.float32)
+    co[:, :3] = coords
+    poly.points.foreach_set("co", co.ravel())
+
+#Read the points of a POLY spline as (N,3) array
+def get_poly_points(poly):
+    co = np.empty(len(poly.points)*4, dtype=np.float32)
+    poly.points.foreach_get("co", co)
+    return co.reshape(-1, 4)[:, :3]
+
 def triangulate_object(obj):
     me = obj.data
     bm = bmesh.new()
@@ -331,8 +1096,10 @@ def triangulate_object(obj):
     bm.to_mesh(me)
     bm.free()
     
-def ray_cast(context, event, coord = None):
-    """Run this function on left mouse, execute the ray cast"""
+@profiling.timed("ray_cast")
+def ray_cast(context, event, coord = None, target = None):
+    """Run this function on left mouse, execute the ray cast
+    With a target object only its mesh is hit, through its cached BVH tree"""
     # get the context arguments
     scene = context.scene
     region = context.region
@@ -344,6 +1111,15 @@ def ray_cast(context, event, coord = None):
     ray_origin = view3d_utils.region_2d_to_origin_3d(region, rv3d, coord)
 
     ray_target = ray_origin + view_vector
+    
+    if target is not None:
+        # ray in object space, no selection changes
+        matrix_inv = target.matrix_world.inverted()
+        ray_origin_obj = matrix_inv @ ray_origin
+        ray_direction_obj = (matrix_inv @ ray_target) - ray_origin_obj
+        location, normal, face_index, _ = mesh_tree(target.data).ray_cast(ray_origin_obj, ray_direction_obj)
+        if location is None: return None, None, None, None
+        return target, location, normal, face_index
 
     def visible_objects_and_duplis():
         """Loop over (object, matrix) pairs (mesh only)"""
@@ -409,3 +1185,14 @@ def ray_cast(context, event, coord = None):
         return best_obj, best_hit, best_norm, best_face
     return None, None, None, None
 
+#Output: True if another object is hit before the world point along the view ray through the region coords
+#Note: one scene ray cast, for the candidates already found visible on the target mesh
+def occluded(context, coord, point, target):
+    region = context.region
+    rv3d = context.region_data
+    view_vector = view3d_utils.region_2d_to_vector_3d(region, rv3d, coord)
+    ray_origin = view3d_utils.region_2d_to_origin_3d(region, rv3d, coord)
+    hit, location, _, _, hit_obj, _ = context.scene.ray_cast(context.evaluated_depsgraph_get(), ray_origin, view_vector)
+    if not hit or hit_obj.original == target: return False
+    return (location - ray_origin).length < (Vector(point) - ray_origin).length - 1e-4
+